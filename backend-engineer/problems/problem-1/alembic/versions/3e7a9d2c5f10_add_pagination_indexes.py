@@ -0,0 +1,36 @@
+"""Add composite indexes for keyset pagination
+
+Revision ID: 3e7a9d2c5f10
+Revises: 8c2f4e1a9b3d
+Create Date: 2026-10-18 11:04:52.683107
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e7a9d2c5f10'
+down_revision: Union[str, Sequence[str], None] = '8c2f4e1a9b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_projects_owner_id_id', 'projects', ['owner_id', 'id'], unique=False)
+    op.create_index('ix_tasks_project_id_id', 'tasks', ['project_id', 'id'], unique=False)
+    op.create_index('ix_tasks_project_id_status_id', 'tasks', ['project_id', 'status', 'id'], unique=False)
+    op.create_index(
+        'ix_tasks_project_id_title', 'tasks', ['project_id', 'title'], unique=False,
+        postgresql_ops={'title': 'text_pattern_ops'},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_tasks_project_id_title', table_name='tasks')
+    op.drop_index('ix_tasks_project_id_status_id', table_name='tasks')
+    op.drop_index('ix_tasks_project_id_id', table_name='tasks')
+    op.drop_index('ix_projects_owner_id_id', table_name='projects')
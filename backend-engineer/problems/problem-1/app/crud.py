@@ -1,53 +1,108 @@
-from sqlalchemy.orm import Session
-from . import models, schemas
-from passlib.context import CryptContext
+from typing import List, Optional, Set
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from . import models, schemas
 
 # User CRUD
 def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = pwd_context.hash(user.password)
+def get_user_by_id(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id == user_id).first()
+
+def bump_token_version(db: Session, user_id: int):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.token_version: models.User.token_version + 1}
+    )
+    db.commit()
+
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    db.query(models.User).filter(models.User.id == user_id).update({models.User.hashed_password: hashed_password})
+    db.commit()
+
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    # Hashing is left to the caller: it is CPU-bound and shouldn't hold a DB session
     db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    # A new user has no projects: mark the relationship loaded so serializing
+    # schemas.User doesn't issue a lazy SELECT for it
+    set_committed_value(db_user, "projects", [])
     return db_user
 
 # Project CRUD
-def get_projects_by_owner(db: Session, owner_id: int):
-    return db.query(models.Project).filter(models.Project.owner_id == owner_id).all()
+def get_projects_by_owner(db: Session, owner_id: int, limit: Optional[int] = None,
+                          after_id: Optional[int] = None, name_prefix: Optional[str] = None):
+    # Keyset pagination: rows after the cursor in id order, served by (owner_id, id)
+    query = db.query(models.Project).filter(models.Project.owner_id == owner_id)
+    if after_id is not None:
+        query = query.filter(models.Project.id > after_id)
+    if name_prefix:
+        query = query.filter(models.Project.name.startswith(name_prefix, autoescape=True))
+    query = query.order_by(models.Project.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
-def get_project_by_id(db: Session, project_id: int):
-    return db.query(models.Project).filter(models.Project.id == project_id).first()
+def get_project_by_id(db: Session, project_id: int, with_tasks: bool = False):
+    # with_tasks for responses that serialize schemas.Project: the tasks come in one
+    # extra SELECT ... WHERE project_id IN (...) instead of a lazy load per project
+    query = db.query(models.Project).filter(models.Project.id == project_id)
+    if with_tasks:
+        query = query.options(selectinload(models.Project.tasks))
+    return query.first()
 
 def create_project(db: Session, project: schemas.ProjectCreate, owner_id: int):
     db_project = models.Project(**project.dict(), owner_id=owner_id)
     db.add(db_project)
     db.commit()
     db.refresh(db_project)
+    set_committed_value(db_project, "tasks", [])
     return db_project
     
 def update_project(db: Session, project_id: int, project_update: schemas.ProjectUpdate):
-    db_project = get_project_by_id(db, project_id)
+    # Usually already in the identity map from the router's ownership check
+    db_project = db.get(models.Project, project_id)
     if db_project:
         update_data = project_update.dict(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_project, key, value)
         db.commit()
-        db.refresh(db_project)
+        # The commit expired everything, tasks included: reload both eagerly
+        db_project = get_project_by_id(db, project_id, with_tasks=True)
     return db_project
     
 def delete_project(db: Session, project_id: int):
-    db_project = get_project_by_id(db, project_id)
-    if db_project:
-        db.delete(db_project)
-        db.commit()
-    return db_project
+    # Set-based: one DELETE for the tasks and one for the project, rather than the
+    # ORM cascade loading every task and deleting it by primary key
+    db.execute(delete(models.Task).where(models.Task.project_id == project_id))
+    deleted_id = db.execute(
+        delete(models.Project).where(models.Project.id == project_id).returning(models.Project.id)
+    ).scalar_one_or_none()
+    db.commit()
+    return deleted_id is not None
 
 # Task CRUD
+def get_tasks_by_project(db: Session, project_id: int, limit: Optional[int] = None,
+                         after_id: Optional[int] = None, status: Optional[models.TaskStatus] = None,
+                         title_prefix: Optional[str] = None):
+    # Keyset pagination on id; with a status filter the order is (status, id),
+    # which (project_id, status, id) serves directly
+    query = db.query(models.Task).filter(models.Task.project_id == project_id)
+    if status is not None:
+        query = query.filter(models.Task.status == status)
+    if after_id is not None:
+        query = query.filter(models.Task.id > after_id)
+    if title_prefix:
+        query = query.filter(models.Task.title.startswith(title_prefix, autoescape=True))
+    query = query.order_by(models.Task.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
 def get_task_by_id(db: Session, task_id: int):
     return db.query(models.Task).filter(models.Task.id == task_id).first()
     
@@ -58,19 +113,117 @@ def create_task(db: Session, task: schemas.TaskCreate, project_id: int):
     db.refresh(db_task)
     return db_task
 
-def update_task(db: Session, task_id: int, task_update: schemas.TaskUpdate):
-    db_task = get_task_by_id(db, task_id)
-    if db_task:
-        update_data = task_update.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_task, key, value)
-        db.commit()
-        db.refresh(db_task)
+def get_task_with_owner(db: Session, task_id: int):
+    # The task and its project's owner in one query; None if the task doesn't exist
+    return (
+        db.query(models.Task, models.Project.owner_id)
+        .outerjoin(models.Project, models.Task.project_id == models.Project.id)
+        .filter(models.Task.id == task_id)
+        .first()
+    )
+
+def get_task_for_owner(db: Session, task_id: int, owner_id: int):
+    return (
+        db.query(models.Task)
+        .join(models.Project, models.Task.project_id == models.Project.id)
+        .filter(models.Task.id == task_id, models.Project.owner_id == owner_id)
+        .first()
+    )
+
+def update_task_for_owner(db: Session, task_id: int, owner_id: int, task_update: schemas.TaskUpdate):
+    """
+    UPDATE tasks ... FROM projects WHERE owner_id = :owner_id RETURNING tasks.*
+    Returns the updated task, or None if it doesn't exist or belongs to someone else.
+    """
+    update_data = task_update.dict(exclude_unset=True)
+    if not update_data:
+        return get_task_for_owner(db, task_id=task_id, owner_id=owner_id)
+    stmt = (
+        update(models.Task)
+        .where(
+            models.Task.id == task_id,
+            models.Task.project_id == models.Project.id,
+            models.Project.owner_id == owner_id,
+        )
+        .values(**update_data)
+        .returning(models.Task)
+        .execution_options(synchronize_session=False)
+    )
+    db_task = db.execute(stmt).scalar_one_or_none()
+    if db_task is not None:
+        # Detach before committing so the RETURNING values aren't expired and reloaded
+        db.expunge(db_task)
+    db.commit()
     return db_task
 
-def delete_task(db: Session, task_id: int):
-    db_task = get_task_by_id(db, task_id)
-    if db_task:
-        db.delete(db_task)
-        db.commit()
-    return db_task
\ No newline at end of file
+def delete_task_for_owner(db: Session, task_id: int, owner_id: int):
+    # Single DELETE scoped to the owner's projects; True if a row was removed
+    stmt = (
+        delete(models.Task)
+        .where(
+            models.Task.id == task_id,
+            models.Task.project_id.in_(select(models.Project.id).where(models.Project.owner_id == owner_id)),
+        )
+        .returning(models.Task.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted_id = db.execute(stmt).scalar_one_or_none()
+    db.commit()
+    return deleted_id is not None
+
+# Bulk Task CRUD: each function is one transaction of set-based statements
+def get_existing_task_ids(db: Session, task_ids: Set[int]) -> Set[int]:
+    if not task_ids:
+        return set()
+    return set(db.scalars(select(models.Task.id).where(models.Task.id.in_(task_ids))))
+
+def create_tasks(db: Session, tasks: List[schemas.TaskCreate], project_id: int):
+    # One multi-row INSERT ... RETURNING. RETURNING order isn't guaranteed, but ids
+    # are drawn in VALUES order, so sorting by id restores the request order
+    # (sort_by_parameter_order would degrade to a row-per-statement insert on SQLite)
+    stmt = insert(models.Task).returning(models.Task)
+    db_tasks = db.scalars(stmt, [dict(task.dict(), project_id=project_id) for task in tasks]).all()
+    db_tasks.sort(key=lambda db_task: db_task.id)
+    for db_task in db_tasks:
+        db.expunge(db_task)
+    db.commit()
+    return db_tasks
+
+def update_task_statuses_for_owner(db: Session, task_ids: Set[int], owner_id: int, status: models.TaskStatus):
+    """
+    UPDATE tasks SET status ... FROM projects WHERE id IN (...) AND owner_id = :owner_id
+    Returns the updated tasks and the ids that exist but belong to someone else.
+    """
+    stmt = (
+        update(models.Task)
+        .where(
+            models.Task.id.in_(task_ids),
+            models.Task.project_id == models.Project.id,
+            models.Project.owner_id == owner_id,
+        )
+        .values(status=status)
+        .returning(models.Task)
+        .execution_options(synchronize_session=False)
+    )
+    db_tasks = db.scalars(stmt).all()
+    for db_task in db_tasks:
+        db.expunge(db_task)
+    forbidden_ids = get_existing_task_ids(db, task_ids - {db_task.id for db_task in db_tasks})
+    db.commit()
+    return db_tasks, forbidden_ids
+
+def delete_tasks_for_owner(db: Session, task_ids: Set[int], owner_id: int):
+    # Returns the deleted ids and the ids that exist but belong to someone else
+    stmt = (
+        delete(models.Task)
+        .where(
+            models.Task.id.in_(task_ids),
+            models.Task.project_id.in_(select(models.Project.id).where(models.Project.owner_id == owner_id)),
+        )
+        .returning(models.Task.id)
+        .execution_options(synchronize_session=False)
+    )
+    deleted_ids = set(db.scalars(stmt))
+    forbidden_ids = get_existing_task_ids(db, task_ids - deleted_ids)
+    db.commit()
+    return deleted_ids, forbidden_ids
@@ -1,17 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
 from . import crud, models, schemas, database
+from .config import settings
 
 # These should be in a config file or environment variables
 SECRET_KEY = "your-super-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+USER_CACHE_MAX_ENTRIES = 10000
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+class UserCache:
+    """
+    In-process TTL cache of `schemas.CurrentUser` keyed by user id, so authorizing a
+    request doesn't need a database round trip. Call `invalidate` whenever a user's
+    identity fields or token version change. That only reaches this process: other
+    workers keep their copy until it expires, so the TTL bounds how stale it can get.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def put(self, user: schemas.CurrentUser):
+        with self._lock:
+            self._entries[user.id] = (user, time.monotonic() + self._ttl_seconds)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return user
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+user_cache = UserCache(settings.USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: database.Runner = Depends(database.get_runner)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -22,11 +70,32 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
+        token_data = schemas.TokenData(
+            username=username, user_id=payload.get("uid"), token_version=payload.get("ver", 0)
+        )
+    except (JWTError, ValueError):
         raise credentials_exception
-    
-    user = crud.get_user_by_username(db, username=token_data.username)
+
+    user = user_cache.get(token_data.user_id) if token_data.user_id is not None else None
     if user is None:
+        if token_data.user_id is not None:
+            db_user = await db.run(crud.get_user_by_id, user_id=token_data.user_id)
+        else:
+            # Tokens issued before the user id was embedded in the claims
+            db_user = await db.run(crud.get_user_by_username, username=token_data.username)
+        if db_user is None:
+            raise credentials_exception
+        user = user_cache.put(schemas.CurrentUser(
+            id=db_user.id, username=db_user.username, token_version=db_user.token_version
+        ))
+
+    if user.username != token_data.username or user.token_version != token_data.token_version:
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+async def get_current_db_user(current_user: schemas.CurrentUser = Depends(get_current_user), db: database.Runner = Depends(database.get_runner)):
+    # For the few endpoints that need the full User row, not just the identity
+    user = await db.run(crud.get_user_by_id, user_id=current_user.id)
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return user
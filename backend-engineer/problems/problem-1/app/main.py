@@ -1,6 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from .database import engine
-from . import models
+from . import db_pool, models
+from .metrics import REGISTRY, MetricsMiddleware, metrics_response, stats_collector
+from .security import PasswordHasherSaturated, password_hasher
 from .routers import auth, projects_tasks
 
 # This line creates the tables if they don't exist. 
@@ -12,10 +15,34 @@ app = FastAPI(
     description="An API for managing projects and tasks.",
     version="1.0.0"
 )
+app.add_middleware(MetricsMiddleware)
+
+REGISTRY.register_collector("password_hasher", stats_collector("password_hasher", password_hasher.stats, counters={"rejected"}))
+
+@app.exception_handler(PasswordHasherSaturated)
+async def password_hasher_saturated(request: Request, exc: PasswordHasherSaturated):
+    # Only auth endpoints hash passwords, so only they shed load here
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication is temporarily overloaded, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
 
 app.include_router(auth.router)
 app.include_router(projects_tasks.router)
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/metrics/db-pool", tags=["Root"])
+def db_pool_metrics():
+    return db_pool.pool_stats()
+
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Welcome to the Task Management API"}
\ No newline at end of file
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 
@@ -14,6 +14,8 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    # Bumped to revoke every token issued so far
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
     
     projects = relationship("Project", back_populates="owner", cascade="all, delete-orphan")
 
@@ -27,6 +29,9 @@ class Project(Base):
     owner = relationship("User", back_populates="projects")
     tasks = relationship("Task", back_populates="project", cascade="all, delete-orphan")
 
+    # Keyset pagination of an owner's projects
+    __table_args__ = (Index("ix_projects_owner_id_id", "owner_id", "id"),)
+
 class Task(Base):
     __tablename__ = "tasks"
     id = Column(Integer, primary_key=True, index=True)
@@ -35,4 +40,18 @@ class Task(Base):
     status = Column(Enum(TaskStatus), default=TaskStatus.TODO, nullable=False)
     project_id = Column(Integer, ForeignKey("projects.id"))
     
-    project = relationship("Project", back_populates="tasks")
\ No newline at end of file
+    project = relationship("Project", back_populates="tasks")
+
+    # Keyset pagination of a project's tasks, optionally within one status,
+    # and title-prefix search (text_pattern_ops lets LIKE 'x%' use the index
+    # on Postgres regardless of collation)
+    __table_args__ = (
+        Index("ix_tasks_project_id_id", "project_id", "id"),
+        Index("ix_tasks_project_id_status_id", "project_id", "status", "id"),
+        Index(
+            "ix_tasks_project_id_title",
+            "project_id",
+            "title",
+            postgresql_ops={"title": "text_pattern_ops"},
+        ),
+    )
\ No newline at end of file
@@ -1,22 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
 from datetime import datetime, timedelta  # <--- THIS IS THE FIX
 from jose import jwt
-from passlib.context import CryptContext
 
 from .. import crud, schemas, database, dependencies
+from ..security import password_hasher
 
 router = APIRouter(
     prefix="/auth",
     tags=["Authentication"]
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -28,23 +22,44 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 @router.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
-    db_user = crud.get_user_by_username(db, username=user.username)
+async def register_user(user: schemas.UserCreate, db: database.Runner = Depends(database.get_runner)):
+    db_user = await db.run(crud.get_user_by_username, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = await password_hasher.hash(user.password)
+    return await db.run(crud.create_user, user=user, hashed_password=hashed_password)
 
 @router.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(database.get_db)):
-    user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: database.Runner = Depends(database.get_runner)):
+    user = await db.run(crud.get_user_by_username, username=form_data.username)
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # The stored hash predates the current CryptContext parameters
+        await db.run(crud.update_password_hash, user_id=user.id, hashed_password=new_hash)
     access_token_expires = timedelta(minutes=dependencies.ACCESS_TOKEN_EXPIRE_MINUTES)
+    # The user id and token version travel in the claims so authorized requests can
+    # skip the user lookup (see dependencies.get_current_user)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": user.username, "uid": user.id, "ver": user.token_version},
+        expires_delta=access_token_expires,
     )
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_tokens(db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    """
+    Invalidates every token issued to the current user so far. This worker rejects
+    them at once; other workers may accept them for up to USER_CACHE_TTL_SECONDS
+    longer, until their cached copy of the user expires.
+    """
+    await db.run(crud.bump_token_version, user_id=current_user.id)
+    dependencies.user_cache.invalidate(current_user.id)
+    return
\ No newline at end of file
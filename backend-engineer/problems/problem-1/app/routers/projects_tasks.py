@@ -1,6 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional
 
 from .. import crud, models, schemas, database, dependencies
 
@@ -8,19 +7,37 @@ router = APIRouter(
     tags=["Projects and Tasks"]
 )
 
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 200
+
+def paginate(rows: list, limit: int) -> dict:
+    # rows were fetched with limit + 1: the extra row only signals another page
+    items = rows[:limit]
+    next_cursor = items[-1].id if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
 # --- Projects Endpoints ---
 
 @router.post("/projects", response_model=schemas.Project, status_code=status.HTTP_201_CREATED)
-def create_project(project: schemas.ProjectCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    return crud.create_project(db=db, project=project, owner_id=current_user.id)
+async def create_project(project: schemas.ProjectCreate, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    return await db.run(crud.create_project, project=project, owner_id=current_user.id)
 
-@router.get("/projects", response_model=List[schemas.Project])
-def read_user_projects(db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    return crud.get_projects_by_owner(db, owner_id=current_user.id)
+@router.get("/projects", response_model=schemas.ProjectSummaryPage)
+async def read_user_projects(
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    name_prefix: Optional[str] = Query(None, min_length=1),
+    db: database.Runner = Depends(database.get_runner),
+    current_user: schemas.CurrentUser = Depends(dependencies.get_current_user),
+):
+    projects = await db.run(
+        crud.get_projects_by_owner, owner_id=current_user.id, limit=limit + 1, after_id=cursor, name_prefix=name_prefix
+    )
+    return paginate(projects, limit)
 
 @router.get("/projects/{project_id}", response_model=schemas.Project)
-def read_project(project_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_project = crud.get_project_by_id(db, project_id=project_id)
+async def read_project(project_id: int, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    db_project = await db.run(crud.get_project_by_id, project_id=project_id, with_tasks=True)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     if db_project.owner_id != current_user.id:
@@ -28,68 +45,117 @@ def read_project(project_id: int, db: Session = Depends(database.get_db), curren
     return db_project
 
 @router.put("/projects/{project_id}", response_model=schemas.Project)
-def update_project(project_id: int, project: schemas.ProjectUpdate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_project = crud.get_project_by_id(db, project_id=project_id)
+async def update_project(project_id: int, project: schemas.ProjectUpdate, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    db_project = await db.run(crud.get_project_by_id, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     if db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this project")
-    return crud.update_project(db=db, project_id=project_id, project_update=project)
+    return await db.run(crud.update_project, project_id=project_id, project_update=project)
 
 @router.delete("/projects/{project_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_project(project_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_project = crud.get_project_by_id(db, project_id=project_id)
+async def delete_project(project_id: int, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    db_project = await db.run(crud.get_project_by_id, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     if db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this project")
-    crud.delete_project(db=db, project_id=project_id)
+    await db.run(crud.delete_project, project_id=project_id)
     return
 
 # --- Tasks Endpoints ---
 
 @router.post("/projects/{project_id}/tasks", response_model=schemas.Task, status_code=status.HTTP_201_CREATED)
-def create_task_for_project(project_id: int, task: schemas.TaskCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_project = crud.get_project_by_id(db, project_id=project_id)
+async def create_task_for_project(project_id: int, task: schemas.TaskCreate, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    db_project = await db.run(crud.get_project_by_id, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     if db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to add tasks to this project")
-    return crud.create_task(db=db, task=task, project_id=project_id)
+    return await db.run(crud.create_task, task=task, project_id=project_id)
 
-@router.get("/projects/{project_id}/tasks", response_model=List[schemas.Task])
-def read_tasks_for_project(project_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_project = crud.get_project_by_id(db, project_id=project_id)
+@router.get("/projects/{project_id}/tasks", response_model=schemas.TaskPage)
+async def read_tasks_for_project(
+    project_id: int,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    task_status: Optional[models.TaskStatus] = Query(None, alias="status"),
+    title_prefix: Optional[str] = Query(None, min_length=1),
+    db: database.Runner = Depends(database.get_runner),
+    current_user: schemas.CurrentUser = Depends(dependencies.get_current_user),
+):
+    db_project = await db.run(crud.get_project_by_id, project_id=project_id)
     if db_project is None:
         raise HTTPException(status_code=404, detail="Project not found")
     if db_project.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to view these tasks")
-    return db_project.tasks
+    tasks = await db.run(
+        crud.get_tasks_by_project, project_id=project_id, limit=limit + 1, after_id=cursor,
+        status=task_status, title_prefix=title_prefix,
+    )
+    return paginate(tasks, limit)
+
+@router.post("/projects/{project_id}/tasks/bulk", response_model=schemas.TaskBulkResult, status_code=status.HTTP_201_CREATED)
+async def create_tasks_for_project(project_id: int, payload: schemas.TaskBulkCreate, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    db_project = await db.run(crud.get_project_by_id, project_id=project_id)
+    if db_project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if db_project.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to add tasks to this project")
+    db_tasks = await db.run(crud.create_tasks, tasks=payload.tasks, project_id=project_id)
+    return {"results": [{"id": t.id, "result": schemas.BulkItemResult.CREATED, "task": t} for t in db_tasks]}
+
+def bulk_results(task_ids: List[int], done: dict, done_result: schemas.BulkItemResult, forbidden_ids: set) -> dict:
+    # done maps each affected id to its task (or None when there is nothing to return)
+    results = []
+    for task_id in dict.fromkeys(task_ids):
+        if task_id in done:
+            results.append({"id": task_id, "result": done_result, "task": done[task_id]})
+        elif task_id in forbidden_ids:
+            results.append({"id": task_id, "result": schemas.BulkItemResult.FORBIDDEN})
+        else:
+            results.append({"id": task_id, "result": schemas.BulkItemResult.NOT_FOUND})
+    return {"results": results}
+
+@router.patch("/tasks/bulk/status", response_model=schemas.TaskBulkResult)
+async def update_task_statuses(payload: schemas.TaskBulkStatusUpdate, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    db_tasks, forbidden_ids = await db.run(
+        crud.update_task_statuses_for_owner, task_ids=set(payload.task_ids), owner_id=current_user.id, status=payload.status
+    )
+    updated = {db_task.id: db_task for db_task in db_tasks}
+    return bulk_results(payload.task_ids, updated, schemas.BulkItemResult.UPDATED, forbidden_ids)
+
+@router.post("/tasks/bulk/delete", response_model=schemas.TaskBulkResult)
+async def delete_tasks(payload: schemas.TaskBulkDelete, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    deleted_ids, forbidden_ids = await db.run(crud.delete_tasks_for_owner, task_ids=set(payload.task_ids), owner_id=current_user.id)
+    deleted = dict.fromkeys(deleted_ids)
+    return bulk_results(payload.task_ids, deleted, schemas.BulkItemResult.DELETED, forbidden_ids)
+
+async def raise_task_not_found_or_forbidden(db: database.Runner, task_id: int, action: str):
+    # Only reached when a scoped statement matched nothing: tell 404 and 403 apart
+    if await db.run(crud.get_task_with_owner, task_id=task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    raise HTTPException(status_code=403, detail=f"Not authorized to {action} this task")
 
 @router.get("/tasks/{task_id}", response_model=schemas.Task)
-def read_task(task_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_task = crud.get_task_by_id(db, task_id=task_id)
-    if db_task is None:
+async def read_task(task_id: int, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    row = await db.run(crud.get_task_with_owner, task_id=task_id)
+    if row is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    if db_task.project.owner_id != current_user.id:
+    db_task, owner_id = row
+    if owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this task")
     return db_task
 
 @router.put("/tasks/{task_id}", response_model=schemas.Task)
-def update_task(task_id: int, task: schemas.TaskUpdate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_task = crud.get_task_by_id(db, task_id=task_id)
+async def update_task(task_id: int, task: schemas.TaskUpdate, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    db_task = await db.run(crud.update_task_for_owner, task_id=task_id, owner_id=current_user.id, task_update=task)
     if db_task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-    if db_task.project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to update this task")
-    return crud.update_task(db=db, task_id=task_id, task_update=task)
+        await raise_task_not_found_or_forbidden(db, task_id, "update")
+    return db_task
 
 @router.delete("/tasks/{task_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_task(task_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    db_task = crud.get_task_by_id(db, task_id=task_id)
-    if db_task is None:
-        raise HTTPException(status_code=404, detail="Task not found")
-    if db_task.project.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized to delete this task")
-    crud.delete_task(db=db, task_id=task_id)
-    return
\ No newline at end of file
+async def delete_task(task_id: int, db: database.Runner = Depends(database.get_runner), current_user: schemas.CurrentUser = Depends(dependencies.get_current_user)):
+    if not await db.run(crud.delete_task_for_owner, task_id=task_id, owner_id=current_user.id):
+        await raise_task_not_found_or_forbidden(db, task_id, "delete")
+    return
@@ -1,7 +1,11 @@
-from pydantic import BaseModel, EmailStr
+import enum
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 from .models import TaskStatus
 
+# Upper bound on items per bulk request, keeping each one a bounded transaction
+BULK_MAX_ITEMS = 500
+
 # Task Schemas
 class TaskBase(BaseModel):
     title: str
@@ -23,6 +27,39 @@ class Task(TaskBase):
     class Config:
         orm_mode = True
 
+class TaskPage(BaseModel):
+    items: List[Task]
+    # Pass back as ?cursor= to fetch the next page; None on the last page
+    next_cursor: Optional[int] = None
+
+# Bulk Task Schemas
+class TaskBulkCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class TaskBulkStatusUpdate(BaseModel):
+    task_ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+    status: TaskStatus
+
+class TaskBulkDelete(BaseModel):
+    task_ids: List[int] = Field(..., min_length=1, max_length=BULK_MAX_ITEMS)
+
+class BulkItemResult(str, enum.Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    NOT_FOUND = "not_found"
+    FORBIDDEN = "forbidden"
+
+class TaskBulkItem(BaseModel):
+    id: int
+    result: BulkItemResult
+    # The task as stored, for created and updated items
+    task: Optional[Task] = None
+
+class TaskBulkResult(BaseModel):
+    # One entry per requested item, in request order (duplicate ids collapsed)
+    results: List[TaskBulkItem]
+
 # Project Schemas
 class ProjectBase(BaseModel):
     name: str
@@ -42,6 +79,18 @@ class Project(ProjectBase):
     class Config:
         orm_mode = True
 
+class ProjectSummary(ProjectBase):
+    # A project without its tasks, for listings
+    id: int
+    owner_id: int
+
+    class Config:
+        orm_mode = True
+
+class ProjectSummaryPage(BaseModel):
+    items: List[ProjectSummary]
+    next_cursor: Optional[int] = None
+
 # User Schemas
 class UserBase(BaseModel):
     username: str
@@ -63,4 +112,12 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
-    username: Optional[str] = None
\ No newline at end of file
+    username: Optional[str] = None
+    user_id: Optional[int] = None
+    token_version: int = 0
+
+class CurrentUser(BaseModel):
+    # The identity fields authorization needs, without loading the full User row
+    id: int
+    username: str
+    token_version: int = 0
\ No newline at end of file
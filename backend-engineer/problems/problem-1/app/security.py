@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from .config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+class PasswordHasherSaturated(Exception):
+    """Raised instead of queueing when the hashing pool already has max_pending jobs."""
+
+# Worker-side functions. The context travels as its config string so workers
+# always hash with the parent's current parameters.
+@lru_cache(maxsize=4)
+def _load_context(config: str) -> CryptContext:
+    return CryptContext.from_string(config)
+
+def _hash(config: str, password: str) -> str:
+    return _load_context(config).hash(password)
+
+def _verify_and_update(config: str, password: str, hashed_password: str):
+    return _load_context(config).verify_and_update(password, hashed_password)
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, bounded process pool so a burst of logins can't
+    starve the event loop or the threadpool the rest of the API depends on.
+    At most `max_pending` jobs are queued or running; beyond that calls raise
+    PasswordHasherSaturated, which the app turns into a 503.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, max_pending: int):
+        self.context = context
+        self._workers = workers
+        self._max_pending = max_pending
+        self._executor = None
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self._rejected += 1
+                raise PasswordHasherSaturated()
+            self._pending += 1
+            if self._executor is None:
+                # spawn, not fork: forking a process with an event loop and threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._workers, mp_context=multiprocessing.get_context("spawn")
+                )
+        try:
+            future = self._executor.submit(fn, self.context.to_string(), *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """(verified, new_hash): new_hash is set when the stored hash uses outdated parameters."""
+        return await self._submit(_verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"pending": self._pending, "max_pending": self._max_pending, "rejected": self._rejected}
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+password_hasher = PasswordHasher(pwd_context, settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
@@ -0,0 +1,120 @@
+"""
+Load benchmark for DB_MODE=sync vs DB_MODE=async.
+
+Starts the API under uvicorn once per mode against DATABASE_URL (schema already
+migrated), seeds a user with a project of tasks, then drives authorized reads at
+increasing concurrency. For each mode it reports throughput and latency per step,
+and the best throughput whose p99 stays within each latency SLO. Run from
+problem-1/:
+
+    DATABASE_URL=postgresql://... python scripts/bench_db_modes.py
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}"
+CONCURRENCY_STEPS = [8, 32, 64, 128, 256]
+STEP_SECONDS = 10
+SLOS_MS = [50, 100, 250]
+TASKS_PER_PROJECT = 50
+
+
+def start_server(mode: str) -> subprocess.Popen:
+    env = dict(os.environ, DB_MODE=mode)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{BASE_URL}/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"uvicorn did not start in {mode} mode")
+
+
+async def seed(client: httpx.AsyncClient):
+    username = f"bench-{uuid.uuid4().hex[:8]}"
+    await client.post("/auth/register", json={"username": username, "email": f"{username}@example.com", "password": "bench"})
+    token = (await client.post("/auth/token", data={"username": username, "password": "bench"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    project_id = (await client.post("/projects", json={"name": "bench"}, headers=headers)).json()["id"]
+    tasks = [{"title": f"task {i}"} for i in range(TASKS_PER_PROJECT)]
+    await client.post(f"/projects/{project_id}/tasks/bulk", json={"tasks": tasks}, headers=headers)
+    return f"/projects/{project_id}/tasks", headers
+
+
+async def run_step(client: httpx.AsyncClient, path: str, headers: dict, concurrency: int):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + STEP_SECONDS
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "rps": len(latencies) / STEP_SECONDS,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def bench_mode(mode: str):
+    server = start_server(mode)
+    try:
+        limits = httpx.Limits(max_connections=max(CONCURRENCY_STEPS))
+        async with httpx.AsyncClient(base_url=BASE_URL, limits=limits, timeout=30) as client:
+            path, headers = await seed(client)
+            steps = []
+            for concurrency in CONCURRENCY_STEPS:
+                step = await run_step(client, path, headers, concurrency)
+                print(
+                    f"  {mode:5} c={concurrency:<4} {step['rps']:8.0f} req/s  "
+                    f"p50 {step['p50_ms']:7.1f} ms  p99 {step['p99_ms']:7.1f} ms  errors {step['errors']}"
+                )
+                steps.append(step)
+            return steps
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    results = {}
+    for mode in ("sync", "async"):
+        print(f"DB_MODE={mode}")
+        results[mode] = asyncio.run(bench_mode(mode))
+
+    print("\nBest throughput within p99 SLO")
+    for slo in SLOS_MS:
+        row = []
+        for mode, steps in results.items():
+            within = [s for s in steps if s["p99_ms"] <= slo and not s["errors"]]
+            best = max(within, key=lambda s: s["rps"]) if within else None
+            row.append(f"{mode} {best['rps']:.0f} req/s @ c={best['concurrency']}" if best else f"{mode} -")
+        print(f"  p99 <= {slo} ms: " + ", ".join(row))
+
+
+if __name__ == "__main__":
+    main()
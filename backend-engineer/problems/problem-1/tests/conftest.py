@@ -1,10 +1,20 @@
+import os
+from contextlib import contextmanager
+
+# Cheap hashes for the suite; must be set before app.config is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from app.main import app
-from app.database import Base, get_db
+from app.database import Base, get_async_db, get_async_runner, get_db, get_runner
+from app.dependencies import user_cache
+from app.metrics import instrument_engine
 
 # Use an in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -14,6 +24,15 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The same database through aiosqlite for DB_MODE=async. NullPool because each
+# TestClient request may run on a fresh event loop
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Count the test engines' statements in the per-request metrics, as the app's engines are
+instrument_engine(engine, "test")
+instrument_engine(async_engine, "test_async")
+
 @pytest.fixture(scope="function")
 def db_session():
     Base.metadata.create_all(bind=engine)
@@ -32,7 +51,57 @@ def client(db_session):
         finally:
             db_session.close()
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    user_cache.clear()
     yield TestClient(app)
     # Clean up
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+    user_cache.clear()
+
+@pytest.fixture(scope="function")
+def async_client(client):
+    # Whatever DB_MODE is configured, route every request through the AsyncSession runner
+    app.dependency_overrides[get_runner] = get_async_runner
+    yield client
+
+class StatementCounter:
+    """Records every SQL statement the test engine executes while attached."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+@pytest.fixture
+def query_budget():
+    """N+1 guard: fail when the wrapped requests run more statements than budgeted.
+
+        with query_budget(2):
+            client.get("/projects/1", headers=headers)
+    """
+    @contextmanager
+    def budget(max_statements: int):
+        counter = StatementCounter()
+        engines = (engine, async_engine.sync_engine)
+        for target in engines:
+            event.listen(target, "before_cursor_execute", counter)
+        try:
+            yield counter
+        finally:
+            for target in engines:
+                event.remove(target, "before_cursor_execute", counter)
+        assert counter.count <= max_statements, (
+            f"{counter.count} statements, budget {max_statements}:\n" + "\n".join(counter.statements)
+        )
+
+    return budget
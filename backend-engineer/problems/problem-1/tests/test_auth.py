@@ -1,6 +1,11 @@
 from fastapi.testclient import TestClient
+from jose import jwt
 import random
 
+from app import models, schemas
+from app.dependencies import user_cache
+from app.security import password_hasher
+
 def test_register_user(client: TestClient):
     username = f"testuser{random.randint(1, 100000)}"
     email = f"{username}@example.com"
@@ -31,4 +36,75 @@ def test_login(client: TestClient):
     assert response.status_code == 200
     data = response.json()
     assert "access_token" in data
-    assert data["token_type"] == "bearer"
\ No newline at end of file
+    assert data["token_type"] == "bearer"
+
+
+def test_token_carries_user_id_and_revoke_invalidates_it(client: TestClient):
+    username = f"revokeuser{random.randint(1, 100000)}"
+    register_response = client.post(
+        "/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": "testpassword"},
+    )
+    user_id = register_response.json()["id"]
+    login_response = client.post("/auth/token", data={"username": username, "password": "testpassword"})
+    token = login_response.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    claims = jwt.get_unverified_claims(token)
+    assert claims["uid"] == user_id
+    assert claims["ver"] == 0
+
+    assert client.get("/projects", headers=headers).status_code == 200
+
+    # Revoking bumps the token version, so the old token stops working immediately
+    assert client.post("/auth/revoke", headers=headers).status_code == 204
+    assert client.get("/projects", headers=headers).status_code == 401
+
+    # A fresh login issues a token for the new version
+    new_token = client.post("/auth/token", data={"username": username, "password": "testpassword"}).json()["access_token"]
+    assert client.get("/projects", headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+
+
+
+def test_other_workers_honour_revoke_once_their_cached_user_expires(client: TestClient):
+    client.post("/auth/register", json={"username": "stale", "email": "stale@example.com", "password": "testpassword"})
+    token = client.post("/auth/token", data={"username": "stale", "password": "testpassword"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = jwt.get_unverified_claims(token)["uid"]
+    assert client.post("/auth/revoke", headers=headers).status_code == 204
+
+    # Another worker cached the user before the revoke and never saw the invalidation
+    user_cache.put(schemas.CurrentUser(id=user_id, username="stale", token_version=0))
+    assert client.get("/projects", headers=headers).status_code == 200
+
+    # Once that copy expires the database is read again and the token is refused
+    user, _ = user_cache._entries[user_id]
+    user_cache._entries[user_id] = (user, 0.0)
+    assert client.get("/projects", headers=headers).status_code == 401
+
+def test_login_rehashes_outdated_password_hash(client: TestClient, db_session):
+    client.post("/auth/register", json={"username": "rehash", "email": "rehash@example.com", "password": "testpassword"})
+    old_hash = db_session.query(models.User.hashed_password).filter(models.User.username == "rehash").scalar()
+
+    original = password_hasher.context
+    rounds = original.to_dict()["bcrypt__rounds"]
+    password_hasher.context = original.copy(bcrypt__rounds=rounds + 1)
+    try:
+        assert client.post("/auth/token", data={"username": "rehash", "password": "testpassword"}).status_code == 200
+    finally:
+        password_hasher.context = original
+
+    db_session.expire_all()
+    new_hash = db_session.query(models.User.hashed_password).filter(models.User.username == "rehash").scalar()
+    assert new_hash != old_hash
+    assert new_hash.startswith(f"$2b${rounds + 1:02d}$")
+    # The new hash still verifies
+    assert client.post("/auth/token", data={"username": "rehash", "password": "testpassword"}).status_code == 200
+
+
+def test_saturated_password_hasher_returns_503(client: TestClient, monkeypatch):
+    monkeypatch.setattr(password_hasher, "_max_pending", 0)
+    response = client.post("/auth/register", json={"username": "shed", "email": "shed@example.com", "password": "testpassword"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert password_hasher.stats()["rejected"] >= 1
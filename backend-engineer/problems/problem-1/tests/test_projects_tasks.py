@@ -1,5 +1,11 @@
+from types import SimpleNamespace
+
 from fastapi.testclient import TestClient
 
+from app import db_pool
+from app.database import get_async_runner, get_runner
+from app.main import app
+
 def get_auth_headers(client: TestClient, username: str = "testprojectuser", password: str = "password123"):
     """Helper function to register and log in a user, returning auth headers."""
     client.post("/auth/register", json={"username": username, "email": f"{username}@example.com", "password": password})
@@ -144,4 +150,223 @@ def test_unauthorized_task_modification_403(client: TestClient):
 
     # User 2 tries to delete User 1's task
     response_delete = client.delete(f"/tasks/{task_id}", headers=headers_user2)
-    assert response_delete.status_code == 403 # Should be Forbidden
\ No newline at end of file
+    assert response_delete.status_code == 403 # Should be Forbidden
+
+
+def test_task_ownership_checks_keep_404_and_403(client: TestClient):
+    headers_owner = get_auth_headers(client, username="scopedowner")
+    project_id = client.post("/projects", json={"name": "Scoped"}, headers=headers_owner).json()["id"]
+    task_id = client.post(f"/projects/{project_id}/tasks", json={"title": "Scoped task"}, headers=headers_owner).json()["id"]
+
+    headers_other = get_auth_headers(client, username="scopedother")
+    assert client.get(f"/tasks/{task_id}", headers=headers_other).status_code == 403
+    assert client.put(f"/tasks/{task_id}", json={"status": "done"}, headers=headers_other).status_code == 403
+    assert client.delete(f"/tasks/{task_id}", headers=headers_other).status_code == 403
+    assert client.put("/tasks/99999", json={"status": "done"}, headers=headers_other).status_code == 404
+    assert client.delete("/tasks/99999", headers=headers_other).status_code == 404
+
+    # The rejected update didn't touch the task
+    response = client.get(f"/tasks/{task_id}", headers=headers_owner)
+    assert response.json()["status"] == "todo"
+
+    # An empty update returns the task unchanged
+    response = client.put(f"/tasks/{task_id}", json={}, headers=headers_owner)
+    assert response.status_code == 200
+    assert response.json()["title"] == "Scoped task"
+
+
+def test_task_listing_is_paginated_and_filterable(client: TestClient):
+    headers = get_auth_headers(client, username="pageowner")
+    project_id = client.post("/projects", json={"name": "Paged"}, headers=headers).json()["id"]
+    for i in range(5):
+        status = "done" if i % 2 else "todo"
+        client.post(f"/projects/{project_id}/tasks", json={"title": f"Task {i}", "status": status}, headers=headers)
+    client.post(f"/projects/{project_id}/tasks", json={"title": "100%_literal"}, headers=headers)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        page = client.get(f"/projects/{project_id}/tasks", params=params, headers=headers).json()
+        seen.extend(task["title"] for task in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["Task 0", "Task 1", "Task 2", "Task 3", "Task 4", "100%_literal"]
+
+    done = client.get(f"/projects/{project_id}/tasks", params={"status": "done"}, headers=headers).json()
+    assert [task["title"] for task in done["items"]] == ["Task 1", "Task 3"]
+    assert done["next_cursor"] is None
+
+    # LIKE wildcards in the prefix are matched literally
+    assert client.get(f"/projects/{project_id}/tasks", params={"title_prefix": "100%"}, headers=headers).json()["items"][0]["title"] == "100%_literal"
+    assert client.get(f"/projects/{project_id}/tasks", params={"title_prefix": "1_0"}, headers=headers).json()["items"] == []
+
+    projects = client.get("/projects", params={"limit": 1}, headers=headers).json()
+    assert projects["items"][0]["name"] == "Paged"
+    assert "tasks" not in projects["items"][0]
+    assert projects["next_cursor"] is None
+
+
+def test_endpoint_query_budgets(client: TestClient, query_budget):
+    # Budgets are per request and independent of how many rows come back, so an
+    # N+1 (a lazy load per project or task) fails here
+    headers = get_auth_headers(client, username="budgetowner")
+    project_ids = [client.post("/projects", json={"name": f"Budget {i}"}, headers=headers).json()["id"] for i in range(3)]
+    for project_id in project_ids:
+        for i in range(4):
+            client.post(f"/projects/{project_id}/tasks", json={"title": f"Task {i}"}, headers=headers)
+    project_id = project_ids[0]
+
+    with query_budget(3):
+        client.post("/auth/register", json={"username": "budgetnew", "email": "budgetnew@example.com", "password": "pw"})
+    with query_budget(2):
+        client.post("/projects", json={"name": "Budget new"}, headers=headers)
+    with query_budget(1):
+        assert len(client.get("/projects", headers=headers).json()["items"]) == 4
+    with query_budget(2):
+        assert len(client.get(f"/projects/{project_id}", headers=headers).json()["tasks"]) == 4
+    with query_budget(4):
+        assert len(client.put(f"/projects/{project_id}", json={"name": "Renamed"}, headers=headers).json()["tasks"]) == 4
+    with query_budget(2):
+        assert len(client.get(f"/projects/{project_id}/tasks", headers=headers).json()["items"]) == 4
+    task_id = client.get(f"/projects/{project_id}/tasks", headers=headers).json()["items"][0]["id"]
+    with query_budget(1):
+        client.get(f"/tasks/{task_id}", headers=headers)
+    with query_budget(1):
+        client.put(f"/tasks/{task_id}", json={"status": "done"}, headers=headers)
+    with query_budget(3):
+        assert client.delete(f"/projects/{project_id}", headers=headers).status_code == 204
+    assert client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
+
+
+def test_bulk_task_operations(client: TestClient, query_budget):
+    headers = get_auth_headers(client, username="bulkowner")
+    project_id = client.post("/projects", json={"name": "Bulk"}, headers=headers).json()["id"]
+    headers_other = get_auth_headers(client, username="bulkother")
+    other_project_id = client.post("/projects", json={"name": "Other"}, headers=headers_other).json()["id"]
+    other_task_id = client.post(f"/projects/{other_project_id}/tasks", json={"title": "Not yours"}, headers=headers_other).json()["id"]
+
+    with query_budget(2):
+        response = client.post(
+            f"/projects/{project_id}/tasks/bulk",
+            json={"tasks": [{"title": f"Bulk {i}"} for i in range(10)]},
+            headers=headers,
+        )
+    assert response.status_code == 201
+    results = response.json()["results"]
+    assert [r["task"]["title"] for r in results] == [f"Bulk {i}" for i in range(10)]
+    assert {r["result"] for r in results} == {"created"}
+    task_ids = [r["id"] for r in results]
+
+    assert client.post(f"/projects/{other_project_id}/tasks/bulk", json={"tasks": [{"title": "x"}]}, headers=headers).status_code == 403
+    assert client.post(f"/projects/{project_id}/tasks/bulk", json={"tasks": []}, headers=headers).status_code == 422
+
+    with query_budget(2):
+        response = client.patch(
+            "/tasks/bulk/status",
+            json={"task_ids": task_ids[:5] + [other_task_id, 99999, task_ids[0]], "status": "done"},
+            headers=headers,
+        )
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["result"] for r in results] == ["updated"] * 5 + ["forbidden", "not_found"]
+    assert results[0]["task"]["status"] == "done"
+    assert client.get(f"/tasks/{other_task_id}", headers=headers_other).json()["status"] == "todo"
+    done = client.get(f"/projects/{project_id}/tasks", params={"status": "done"}, headers=headers).json()["items"]
+    assert [t["id"] for t in done] == task_ids[:5]
+
+    with query_budget(2):
+        response = client.post("/tasks/bulk/delete", json={"task_ids": task_ids + [other_task_id, 99999]}, headers=headers)
+    assert [r["result"] for r in response.json()["results"]] == ["deleted"] * 10 + ["forbidden", "not_found"]
+    assert client.get(f"/projects/{project_id}/tasks", headers=headers).json()["items"] == []
+    assert client.get(f"/tasks/{other_task_id}", headers=headers_other).status_code == 200
+
+
+def test_async_db_mode(async_client: TestClient, query_budget):
+    # Responses are serialized outside the AsyncSession, so any lazy load here
+    # would fail with MissingGreenlet rather than silently issue a query
+    headers = get_auth_headers(async_client, username="asyncowner")
+    project_id = async_client.post("/projects", json={"name": "Async"}, headers=headers).json()["id"]
+    async_client.post(f"/projects/{project_id}/tasks/bulk", json={"tasks": [{"title": "A"}, {"title": "B"}]}, headers=headers)
+
+    with query_budget(2):
+        response = async_client.get(f"/projects/{project_id}", headers=headers)
+    assert [task["title"] for task in response.json()["tasks"]] == ["A", "B"]
+    response = async_client.put(f"/projects/{project_id}", json={"name": "Async renamed"}, headers=headers)
+    assert response.json()["name"] == "Async renamed"
+    assert len(response.json()["tasks"]) == 2
+
+    task_id = response.json()["tasks"][0]["id"]
+    assert async_client.put(f"/tasks/{task_id}", json={"status": "done"}, headers=headers).json()["status"] == "done"
+    assert async_client.delete(f"/projects/{project_id}", headers=headers).status_code == 204
+    assert async_client.get(f"/tasks/{task_id}", headers=headers).status_code == 404
+
+
+def metric_value(body: str, sample: str) -> float:
+    for line in body.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_metrics_are_labelled_by_route_template(client: TestClient):
+    headers = get_auth_headers(client)
+    project_id = client.post("/projects", json={"name": "Metrics"}, headers=headers).json()["id"]
+    before = client.get("/metrics").text
+    for _ in range(2):
+        assert client.get(f"/projects/{project_id}", headers=headers).status_code == 200
+    assert client.get("/projects/999999", headers=headers).status_code == 404
+    assert client.get("/no-such-path").status_code == 404
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    ok = 'http_request_duration_seconds_count{method="GET",route="/projects/{project_id}",status="200"}'
+    missing = 'http_request_duration_seconds_count{method="GET",route="/projects/{project_id}",status="404"}'
+    assert metric_value(body, ok) - metric_value(before, ok) == 2
+    assert metric_value(body, missing) - metric_value(before, missing) == 1
+    assert 'route="unmatched",status="404"' in body
+    # Raw ids never become label values
+    assert f"/projects/{project_id}\"" not in body
+
+    # Statements are attributed to the request that ran them, in async mode too
+    statements = 'http_request_db_statements_sum{route="/projects/{project_id}"}'
+    assert metric_value(body, statements) - metric_value(before, statements) >= 3
+    app.dependency_overrides[get_runner] = get_async_runner
+    assert client.get(f"/projects/{project_id}", headers=headers).status_code == 200
+    after_async = client.get("/metrics").text
+    assert metric_value(after_async, statements) > metric_value(body, statements)
+    assert 'db_pool_size{engine="sync"}' in after_async
+
+
+def test_pool_counts_connections_opened_beyond_pool_size(tmp_path):
+    settings = SimpleNamespace(
+        DB_POOL_SIZE=1, DB_MAX_OVERFLOW=2, DB_POOL_TIMEOUT=1, DB_POOL_RECYCLE=-1, DB_POOL_PRE_PING=False,
+        DB_STATEMENT_TIMEOUT_MS=0,
+    )
+    engine = db_pool.create_instrumented_engine("overflow-test", f"sqlite:///{tmp_path / 'pool.db'}", settings)
+    try:
+        connections = [engine.connect() for _ in range(3)]
+        assert db_pool.pool_stats()["overflow-test"]["overflow_opened"] == 2
+
+        # Reconnecting a pooled connection while past pool_size opens nothing new
+        connections[-1].invalidate()
+        connections[-1].close()
+        connections[-1] = engine.connect()
+        assert db_pool.pool_stats()["overflow-test"]["overflow_opened"] == 2
+        for connection in connections:
+            connection.close()
+
+        # The listener carries over to the pool that dispose() puts in place
+        engine.dispose()
+        connections = [engine.connect() for _ in range(2)]
+        assert db_pool.pool_stats()["overflow-test"]["overflow_opened"] == 3
+        for connection in connections:
+            connection.close()
+    finally:
+        engine.dispose()
+        db_pool._engines.pop("overflow-test")
@@ -0,0 +1,93 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from jose import jwt as jose_jwt, JWTError
+
+try:
+    import jwt as pyjwt
+except ImportError:  # PyJWT is optional; python-jose is always available
+    pyjwt = None
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def make_decoder(backend, secret_key, algorithms):
+    """
+    Returns a `decode(token) -> claims` function for the configured JWT library.
+    The key is prepared once here rather than on every request.
+    """
+    key = secret_key.encode("utf-8")
+
+    if backend == "pyjwt":
+        if pyjwt is None:
+            raise RuntimeError("JWT_BACKEND=pyjwt requires the PyJWT package")
+        decoder = pyjwt.PyJWT()
+
+        def decode(token):
+            try:
+                return decoder.decode(token, key, algorithms=algorithms)
+            except pyjwt.PyJWTError as e:
+                raise InvalidToken(str(e))
+        return decode
+
+    if backend == "jose":
+        def decode(token):
+            try:
+                return jose_jwt.decode(token, key, algorithms=algorithms)
+            except JWTError as e:
+                raise InvalidToken(str(e))
+        return decode
+
+    raise ValueError(f"Unknown JWT backend: {backend}")
+
+
+class VerifiedTokenCache:
+    """
+    LRU of tokens that already passed signature verification, keyed by the token's
+    SHA-256 digest so raw tokens are never kept in memory. An entry lives until the
+    token's own `exp` (capped at `max_ttl` seconds). The gateway runs a single event
+    loop, so no locking is needed.
+    """
+
+    def __init__(self, max_entries, max_ttl):
+        self._max_entries = max_entries
+        self._max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is not None:
+            user_id, expires_at = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return user_id
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, token, user_id, exp=None):
+        expires_at = time.time() + self._max_ttl
+        if exp is not None:
+            expires_at = min(expires_at, float(exp))
+        key = self._key(token)
+        self._entries[key] = (user_id, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "max_entries": self._max_entries, "hits": self.hits, "misses": self.misses}
@@ -1,13 +1,69 @@
-from fastapi import FastAPI, Request, Depends, HTTPException, status
+from fastapi import FastAPI, Request, HTTPException, status
 from fastapi.responses import JSONResponse
-import httpx
-from jose import jwt, JWTError
 
+from shared.app.log import setup_logging
+from shared.app.metrics import REGISTRY, MetricsMiddleware, metrics_response, stats_collector
 from shared.app.settings import Settings
+from shared.app.tracing import TracingMiddleware, setup as setup_tracing, tracer
+from .auth import InvalidToken, VerifiedTokenCache, make_decoder
+from .proxy import Route, Upstream, forward
+from .ratelimit import LoginRateLimiter, MemoryBucketStore, RedisBucketStore, login_username
 
 app = FastAPI(title="API Gateway")
 settings = Settings()
-client = httpx.AsyncClient()
+setup_logging("api_gateway", settings)
+setup_tracing("api_gateway", settings)
+app.add_middleware(MetricsMiddleware, track_db=False)
+app.add_middleware(TracingMiddleware, accept_incoming=False)
+
+decode_token = make_decoder(settings.JWT_BACKEND, settings.JWT_SECRET_KEY, algorithms=["HS256"])
+token_cache = VerifiedTokenCache(settings.JWT_CACHE_SIZE, settings.JWT_CACHE_MAX_TTL)
+
+def build_rate_limit_store():
+    if settings.GATEWAY_RATE_LIMIT_BACKEND == "redis":
+        return RedisBucketStore(settings.GATEWAY_RATE_LIMIT_REDIS_URL)
+    if settings.GATEWAY_RATE_LIMIT_BACKEND == "memory":
+        return MemoryBucketStore(settings.GATEWAY_RATE_LIMIT_MAX_KEYS)
+    raise ValueError(f"Unknown rate limit backend: {settings.GATEWAY_RATE_LIMIT_BACKEND}")
+
+login_limiter = LoginRateLimiter(
+    build_rate_limit_store(),
+    ip_capacity=settings.LOGIN_RATE_LIMIT_IP_BURST,
+    ip_per_minute=settings.LOGIN_RATE_LIMIT_IP_PER_MINUTE,
+    username_capacity=settings.LOGIN_RATE_LIMIT_USERNAME_BURST,
+    username_per_minute=settings.LOGIN_RATE_LIMIT_USERNAME_PER_MINUTE,
+)
+# Login bodies are tiny; anything larger is rejected rather than buffered
+MAX_LOGIN_BODY_BYTES = 4096
+
+def build_upstream(name, base_url):
+    return Upstream(
+        name,
+        base_url,
+        max_connections=settings.GATEWAY_UPSTREAM_MAX_CONNECTIONS.get(name, settings.GATEWAY_MAX_CONNECTIONS),
+        max_keepalive=settings.GATEWAY_MAX_KEEPALIVE,
+        connect_timeout=settings.GATEWAY_CONNECT_TIMEOUT,
+        read_timeout=settings.GATEWAY_UPSTREAM_READ_TIMEOUT.get(name, settings.GATEWAY_READ_TIMEOUT),
+        http2=settings.GATEWAY_HTTP2,
+    )
+
+upstreams = {
+    "user_service": build_upstream("user_service", settings.USER_SERVICE_URL),
+    "product_service": build_upstream("product_service", settings.PRODUCT_SERVICE_URL),
+    "order_service": build_upstream("order_service", settings.ORDER_SERVICE_URL),
+}
+
+ROUTES = [
+    # --- User Service Routes ---
+    Route("/register", ["POST"], "user_service"),
+    Route("/token", ["POST"], "user_service", login=True),
+    # --- Product Service Routes ---
+    Route("/products", ["POST"], "product_service", auth=True),
+    Route("/products/{product_id}", ["GET"], "product_service"),
+    # --- Order Service Routes ---
+    # Pass the authenticated user's ID to the order service in a header
+    Route("/orders", ["POST"], "order_service", auth=True, forward_user=True),
+]
 
 async def get_current_user_id(request: Request):
     auth_header = request.headers.get("Authorization")
@@ -15,44 +71,84 @@ async def get_current_user_id(request: Request):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
     
     token = auth_header.split(" ")[1]
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        return user_id
+
+    try:
+        payload = decode_token(token)
+    except InvalidToken:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token: User ID missing")
     try:
-        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=["HS256"])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token: User ID missing")
-        return int(user_id)
-    except JWTError:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    token_cache.put(token, user_id, exp=payload.get("exp"))
+    return user_id
 
-# --- User Service Routes ---
-@app.post("/register")
-@app.post("/token")
-async def user_auth_routes(request: Request):
-    url = f"{settings.USER_SERVICE_URL}{request.url.path}"
-    body = await request.json()
-    response = await client.post(url, json=body)
-    return JSONResponse(status_code=response.status_code, content=response.json())
-
-# --- Product Service Routes ---
-@app.post("/products")
-async def create_product(request: Request, user_id: int = Depends(get_current_user_id)):
-    url = f"{settings.PRODUCT_SERVICE_URL}{request.url.path}"
-    body = await request.json()
-    response = await client.post(url, json=body)
-    return JSONResponse(status_code=response.status_code, content=response.json())
-
-@app.get("/products/{product_id}")
-async def get_product(request: Request, product_id: int):
-    url = f"{settings.PRODUCT_SERVICE_URL}{request.url.path}"
-    response = await client.get(url)
-    return JSONResponse(status_code=response.status_code, content=response.json())
-
-# --- Order Service Routes ---
-@app.post("/orders")
-async def create_order(request: Request, user_id: int = Depends(get_current_user_id)):
-    url = f"{settings.ORDER_SERVICE_URL}{request.url.path}"
-    body = await request.json()
-    # Pass the authenticated user's ID to the order service in a header
-    headers = {"user-id": str(user_id)}
-    response = await client.post(url, json=body, headers=headers)
-    return JSONResponse(status_code=response.status_code, content=response.json())
\ No newline at end of file
+async def check_login_rate_limit(request: Request):
+    """Returns a 429 response if this attempt should be shed, else None."""
+    content_length = request.headers.get("content-length")
+    if content_length is None or not content_length.isdigit():
+        return JSONResponse(status_code=status.HTTP_411_LENGTH_REQUIRED, content={"detail": "Content-Length required"})
+    if int(content_length) > MAX_LOGIN_BODY_BYTES:
+        return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, content={"detail": "Login body too large"})
+    # Starlette caches the body, so forward() still streams it upstream afterwards
+    username = login_username(await request.body())
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = await login_limiter.check(client_ip, username)
+    if retry_after:
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": "Too many login attempts"},
+            headers={"Retry-After": str(retry_after)},
+        )
+    return None
+
+def make_proxy_handler(route: Route):
+    upstream = upstreams[route.upstream]
+
+    async def proxy_handler(request: Request):
+        if route.login:
+            with tracer.start_span("login rate limit"):
+                rejection = await check_login_rate_limit(request)
+            if rejection is not None:
+                return rejection
+        extra_headers = {}
+        if route.auth:
+            with tracer.start_span("authenticate"):
+                user_id = await get_current_user_id(request)
+            if route.forward_user:
+                extra_headers["user-id"] = str(user_id)
+        return await forward(request, upstream, extra_headers)
+    return proxy_handler
+
+for route in ROUTES:
+    app.add_api_route(route.path, make_proxy_handler(route), methods=route.methods)
+
+REGISTRY.register_collector("token_cache", stats_collector("gateway_token_cache", token_cache.stats, counters={"hits", "misses"}))
+REGISTRY.register_collector(
+    "login_rate_limit",
+    stats_collector("gateway_login_rate_limit", login_limiter.stats, counters={"allowed", "shed_ip", "shed_username", "store_errors"}),
+)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+@app.get("/metrics/token-cache")
+async def token_cache_metrics():
+    return token_cache.stats()
+
+@app.get("/metrics/rate-limit")
+async def rate_limit_metrics():
+    return login_limiter.stats()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await login_limiter.aclose()
+    for upstream in upstreams.values():
+        await upstream.aclose()
@@ -0,0 +1,88 @@
+import httpx
+from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from shared.app.metrics import UPSTREAM_ERRORS, instrument_httpx
+from shared.app.tracing import TracingTransport
+
+# Connection-scoped headers that must not be forwarded across a proxy hop
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "trailers", "transfer-encoding", "upgrade",
+}
+# Never trust these from the client; the gateway sets them itself (traces start here)
+GATEWAY_OWNED_HEADERS = {"host", "user-id", "traceparent", "tracestate"}
+
+
+class Route:
+    def __init__(self, path, methods, upstream, auth=False, forward_user=False, login=False):
+        self.path = path
+        self.methods = methods
+        self.upstream = upstream
+        self.auth = auth
+        self.forward_user = forward_user
+        # Credential checks: rate limited per client IP and per account
+        self.login = login
+
+
+class Upstream:
+    """A backend service with its own pooled client."""
+
+    def __init__(self, name, base_url, max_connections, max_keepalive, connect_timeout, read_timeout, http2=False):
+        self.name = name
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            http2=http2,
+        )
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            transport=TracingTransport(transport, name),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        instrument_httpx(self.client, name)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def _request_headers(request: Request, extra_headers):
+    headers = [
+        (key, value) for key, value in request.headers.raw
+        if key.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS | GATEWAY_OWNED_HEADERS
+    ]
+    headers.extend((key.encode("latin-1"), value.encode("latin-1")) for key, value in extra_headers.items())
+    return headers
+
+
+async def forward(request: Request, upstream: Upstream, extra_headers=None):
+    """
+    Forwards the request to `upstream` and streams the response back unchanged:
+    raw body bytes, status and headers pass through without being decoded.
+    """
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+    upstream_request = upstream.client.build_request(
+        request.method,
+        httpx.URL(path=request.url.path, query=request.url.query.encode("latin-1")),
+        headers=_request_headers(request, extra_headers or {}),
+        content=request.stream() if has_body else None,
+    )
+    try:
+        upstream_response = await upstream.client.send(upstream_request, stream=True)
+    except httpx.TimeoutException:
+        UPSTREAM_ERRORS.labels(upstream.name, "timeout").inc()
+        return JSONResponse(status_code=504, content={"detail": f"{upstream.name} timed out"})
+    except httpx.HTTPError:
+        UPSTREAM_ERRORS.labels(upstream.name, "unavailable").inc()
+        return JSONResponse(status_code=502, content={"detail": f"{upstream.name} is unavailable"})
+
+    response = StreamingResponse(
+        upstream_response.aiter_raw(),
+        status_code=upstream_response.status_code,
+        background=BackgroundTask(upstream_response.aclose),
+    )
+    response.raw_headers = [
+        (key, value) for key, value in upstream_response.headers.raw
+        if key.decode("latin-1").lower() not in HOP_BY_HOP_HEADERS
+    ]
+    return response
@@ -0,0 +1,143 @@
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is optional; the in-memory store is the default
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBucketStore:
+    """
+    Token buckets held in this process: an LRU of `key -> (tokens, updated_at)`,
+    bounded at `max_keys` so a spray of random usernames can't grow it without
+    limit. The gateway runs a single event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_keys):
+        self._max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key, capacity, refill_per_second):
+        """Takes one token; returns 0 if allowed, otherwise seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / refill_per_second
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self._max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def aclose(self):
+        pass
+
+
+# KEYS[1] bucket hash; ARGV: capacity, refill per second. Uses the Redis clock so
+# every gateway replica sees the same bucket state.
+TAKE_TOKEN_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every gateway replica, updated atomically by a Lua script."""
+
+    def __init__(self, url, prefix="gateway:ratelimit:"):
+        if aioredis is None:
+            raise RuntimeError("GATEWAY_RATE_LIMIT_BACKEND=redis requires the redis package")
+        self._client = aioredis.from_url(url)
+        self._script = self._client.register_script(TAKE_TOKEN_SCRIPT)
+        self._prefix = prefix
+
+    async def take(self, key, capacity, refill_per_second):
+        return float(await self._script(keys=[self._prefix + key], args=[capacity, refill_per_second]))
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+class LoginRateLimiter:
+    """
+    Sheds login attempts before they reach user_service, where each one costs a
+    bcrypt verification. Every attempt takes a token from its client IP's bucket
+    and, when the body names an account, from that account's bucket too, so both
+    a single noisy client and a distributed attack on one account are throttled.
+    If the store fails the limiter fails open: logins keep working without it.
+    """
+
+    def __init__(self, store, ip_capacity, ip_per_minute, username_capacity, username_per_minute):
+        self._store = store
+        self._ip_limit = (ip_capacity, ip_per_minute / 60)
+        self._username_limit = (username_capacity, username_per_minute / 60)
+        self.allowed = 0
+        self.shed_ip = 0
+        self.shed_username = 0
+        self.store_errors = 0
+
+    async def check(self, client_ip, username=None):
+        """Returns 0 if the attempt may proceed, otherwise whole seconds to wait."""
+        try:
+            retry_after = await self._store.take(f"ip:{client_ip}", *self._ip_limit)
+            if retry_after:
+                self.shed_ip += 1
+                return math.ceil(retry_after)
+            if username:
+                retry_after = await self._store.take(f"user:{username}", *self._username_limit)
+                if retry_after:
+                    self.shed_username += 1
+                    return math.ceil(retry_after)
+        except Exception:
+            self.store_errors += 1
+            logger.exception("Rate limit store failed; allowing the attempt")
+        self.allowed += 1
+        return 0
+
+    def stats(self):
+        return {
+            "allowed": self.allowed,
+            "shed_ip": self.shed_ip,
+            "shed_username": self.shed_username,
+            "store_errors": self.store_errors,
+        }
+
+    async def aclose(self):
+        await self._store.aclose()
+
+
+def login_username(body):
+    """The account a login body names (user_service takes {"email", "password"}), normalized."""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    username = payload.get("email") if isinstance(payload, dict) else None
+    if not isinstance(username, str):
+        return None
+    return username.strip().lower() or None
@@ -1,9 +1,28 @@
+import json
 from sqlalchemy.orm import Session
 from . import models
+from shared.app import tracing
 
-def create_order(db: Session, user_id: int, total_price: float):
-    db_order = models.Order(user_id=user_id, total_price=total_price)
+ORDER_CREATED = "order_created"
+
+def create_order(db: Session, user_id: int, total_price: float, items, reservation_id=None):
+    db_order = models.Order(user_id=user_id, total_price=total_price, reservation_id=reservation_id)
     db.add(db_order)
+    db.flush()  # assigns the order id used in the event payload
+
+    # Written in the same transaction as the order, so the event can't be lost
+    db.add(models.OutboxEvent(
+        event_type=ORDER_CREATED,
+        payload=json.dumps({
+            "id": db_order.id,
+            "items": [item.model_dump() for item in items],
+            "reservation_id": reservation_id,
+        }),
+        trace_context=tracing.current_traceparent(),
+    ))
     db.commit()
     db.refresh(db_order)
-    return db_order
\ No newline at end of file
+    return db_order
+
+def count_pending_outbox_events(db: Session):
+    return db.query(models.OutboxEvent).filter(models.OutboxEvent.published_at.is_(None)).count()
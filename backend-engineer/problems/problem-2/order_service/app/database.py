@@ -1,10 +1,10 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from shared.app.db_pool import create_instrumented_engine
 from shared.app.settings import Settings
 from . import models
 
 settings = Settings()
-engine = create_engine(settings.DATABASE_URL)
+engine = create_instrumented_engine("order_service", settings.DATABASE_URL, settings)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
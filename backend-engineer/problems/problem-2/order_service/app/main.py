@@ -1,43 +1,147 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import httpx
+import logging
 
-from . import crud, database, models, pika_client
-from shared.app import schemas, settings
+from . import crud, database, models, outbox_relay, pika_client
+from shared.app import db_pool, schemas, settings
+from shared.app.log import setup_logging
+from shared.app.metrics import REGISTRY, UPSTREAM_ERRORS, MetricsMiddleware, instrument_httpx, metrics_response, stats_collector
+from shared.app.tracing import TracingMiddleware, TracingTransport, setup as setup_tracing
 
 app = FastAPI(title="Order Service")
 
 
 settings_obj = settings.Settings()
+setup_logging("order_service", settings_obj)
+setup_tracing("order_service", settings_obj)
+logger = logging.getLogger(__name__)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+# One pooled client for the lifetime of the process instead of a new one per order
+product_client = httpx.AsyncClient(
+    base_url=settings_obj.PRODUCT_SERVICE_URL,
+    transport=TracingTransport(
+        httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings_obj.PRODUCT_SERVICE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings_obj.PRODUCT_SERVICE_MAX_KEEPALIVE,
+            ),
+        ),
+        "product_service",
+    ),
+    timeout=settings_obj.PRODUCT_SERVICE_TIMEOUT,
+)
+instrument_httpx(product_client, "product_service")
+
+REGISTRY.register_collector(
+    "publisher",
+    stats_collector(
+        "order_publisher", pika_client.publisher.stats, counters={"published", "failed", "rejected", "reconnects", "batches"}
+    ),
+)
+REGISTRY.register_collector("outbox_relay", stats_collector("order_outbox_relay", outbox_relay.relay.stats, counters={"relayed", "errors"}))
+
+@app.on_event("startup")
+async def startup_event():
+    pika_client.publisher.start()
+    outbox_relay.relay.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await product_client.aclose()
+    await run_in_threadpool(outbox_relay.relay.stop)
+    await run_in_threadpool(pika_client.publisher.stop)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/metrics/publisher")
+def publisher_metrics():
+    return pika_client.publisher.stats()
+
+@app.get("/metrics/outbox")
+def outbox_metrics(db: Session = Depends(database.get_db)):
+    return {**outbox_relay.relay.stats(), "pending": crud.count_pending_outbox_events(db)}
+
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    return db_pool.pool_stats()
+
+async def fetch_products(product_ids):
+    # Resolve every product in the cart with a single batch lookup
+    try:
+        response = await product_client.get("/products", params={"ids": product_ids})
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        UPSTREAM_ERRORS.labels("product_service", type(e).__name__).inc()
+        raise HTTPException(status_code=500, detail="Product service is unavailable")
+    return {product['id']: product for product in response.json()}
+
+async def reserve_stock(quantities):
+    # Holds the stock atomically in product_service; the order event later confirms it
+    items = [{"product_id": product_id, "quantity": quantity} for product_id, quantity in quantities.items()]
+    try:
+        response = await product_client.post("/reservations", json={"items": items})
+    except httpx.HTTPError as e:
+        UPSTREAM_ERRORS.labels("product_service", type(e).__name__).inc()
+        raise HTTPException(status_code=500, detail="Product service is unavailable")
+    if response.status_code == 409:
+        product_id = response.json()["detail"]["product_ids"][0]
+        raise HTTPException(status_code=400, detail=f"Not enough stock for product ID {product_id}")
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail=response.json()["detail"])
+    if response.status_code != 201:
+        raise HTTPException(status_code=500, detail="Product service is unavailable")
+    return response.json()["id"]
+
+async def release_stock(reservation_id):
+    try:
+        await product_client.post(f"/reservations/{reservation_id}/release")
+    except httpx.HTTPError as e:
+        UPSTREAM_ERRORS.labels("product_service", type(e).__name__).inc()
+        # The reservation expires on its own; this only returns the stock sooner
+        logger.warning("Failed to release reservation", extra={"reservation_id": reservation_id, "error": str(e)})
 
 @app.post("/orders", response_model=schemas.Order, status_code=201)
 async def create_order(order: schemas.OrderCreate, user_id: int = Header(...), db: Session = Depends(database.get_db)):
+    # Collapse repeated lines for the same product so the stock check sees the full quantity
+    requested = {}
+    for item in order.items:
+        requested[item.product_id] = requested.get(item.product_id, 0) + item.quantity
+    if not requested:
+        raise HTTPException(status_code=400, detail="An order needs at least one item")
+
+    products = await fetch_products(list(requested))
+
     total_price = 0.0
-    
-    async with httpx.AsyncClient() as client:
-        for item in order.items:
-            try:
-                response = await client.get(f"{settings_obj.PRODUCT_SERVICE_URL}/products/{item.product_id}")
-                response.raise_for_status()
-                product = response.json()
-
-                if product['quantity'] < item.quantity:
-                    raise HTTPException(status_code=400, detail=f"Not enough stock for product ID {item.product_id}")
-                
-                total_price += product['price'] * item.quantity
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    raise HTTPException(status_code=404, detail=f"Product with ID {item.product_id} not found")
-                else:
-                    raise HTTPException(status_code=500, detail="Product service is unavailable")
-
-    db_order = crud.create_order(db, user_id=user_id, total_price=total_price)
-    
-    # Publish event to RabbitMQ for inventory update
-    pika_client.publish_order_created(db_order.id, order.items)
+    for product_id, quantity in requested.items():
+        product = products.get(product_id)
+        if product is None:
+            raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found")
+        # Cheap early rejection only; the reservation below is what actually guarantees stock
+        if product['quantity'] < quantity:
+            raise HTTPException(status_code=400, detail=f"Not enough stock for product ID {product_id}")
+        total_price += product['price'] * quantity
+
+    reservation_id = await reserve_stock(requested)
+
+    # The order_created event is written to the outbox in the same transaction;
+    # the background relay publishes it to RabbitMQ, and product_service confirms
+    # the reservation when it consumes it.
+    try:
+        db_order = crud.create_order(
+            db, user_id=user_id, total_price=total_price, items=order.items, reservation_id=reservation_id
+        )
+    except Exception:
+        await release_stock(reservation_id)
+        raise
     
     # Enrich the response with items for clarity
     response_order = schemas.Order.from_orm(db_order)
     response_order.items = order.items
     
-    return response_order
\ No newline at end of file
+    return response_order
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text, DateTime, Index
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -8,4 +9,21 @@ class Order(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False)
     total_price = Column(Float, nullable=False)
-    status = Column(String, default="PENDING")
\ No newline at end of file
+    status = Column(String, default="PENDING")
+    reservation_id = Column(String, nullable=True)
+
+class OutboxEvent(Base):
+    # Events written in the same transaction as the order and relayed to RabbitMQ afterwards
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    published_at = Column(DateTime, nullable=True)
+    # traceparent of the request that wrote the event, so the trace continues through RabbitMQ
+    trace_context = Column(String, nullable=True)
+
+    __table_args__ = (
+        # The relay only ever scans unpublished rows
+        Index("ix_outbox_unpublished", "id", postgresql_where=published_at.is_(None)),
+    )
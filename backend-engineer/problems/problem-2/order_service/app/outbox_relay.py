@@ -0,0 +1,122 @@
+import logging
+import threading
+from datetime import datetime
+from . import database, models, pika_client
+from shared.app.settings import Settings
+from shared.app.tracing import parse_traceparent, tracer
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+
+
+class OutboxRelay:
+    """
+    Drains the outbox table on a background thread and publishes each event with
+    broker confirms. Rows are claimed with FOR UPDATE SKIP LOCKED, so several
+    order_service replicas can relay side by side without double-sending a batch.
+    An event is only marked published after its confirm arrives; anything else is
+    retried on the next pass (at-least-once delivery).
+    """
+
+    def __init__(self, session_factory, publisher, batch_size, poll_interval, confirm_timeout):
+        self._session_factory = session_factory
+        self._publisher = publisher
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._confirm_timeout = confirm_timeout
+        self._stopping = threading.Event()
+        self._thread = None
+
+        self.relayed = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def relay_once(self):
+        db = self._session_factory()
+        try:
+            events = (
+                db.query(models.OutboxEvent)
+                .filter(models.OutboxEvent.published_at.is_(None))
+                .order_by(models.OutboxEvent.id)
+                .limit(self._batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not events:
+                db.rollback()
+                return 0
+
+            # Hand the whole batch over first, then wait for the confirms
+            pending = []
+            for event in events:
+                span = self._publish_span(event)
+                headers = {"traceparent": span.context.traceparent()}
+                pending.append((event, span, self._publisher.publish(event.payload, headers=headers)))
+            published_at = datetime.utcnow()
+            sent = 0
+            for event, span, future in pending:
+                try:
+                    future.result(timeout=self._confirm_timeout)
+                except Exception as e:
+                    self.errors += 1
+                    span.set_error(e)
+                    logger.warning("Outbox event not confirmed, will retry", extra={"event_id": event.id, "error": str(e)})
+                    continue
+                finally:
+                    span.end()
+                event.published_at = published_at
+                sent += 1
+            db.commit()
+            self.relayed += sent
+            return sent
+        finally:
+            db.close()
+
+    def stats(self):
+        return {"relayed": self.relayed, "errors": self.errors}
+
+    @staticmethod
+    def _publish_span(event):
+        # Continues the trace of the request that wrote the event; the time the event
+        # sat in the outbox shows up as the gap before this span
+        return tracer.start_span(
+            f"publish {event.event_type}",
+            kind="producer",
+            parent=parse_traceparent(event.trace_context),
+            attributes={
+                "messaging.destination": pika_client.ORDER_CREATED_QUEUE,
+                "outbox.event_id": event.id,
+                "outbox.wait_seconds": round((datetime.utcnow() - event.created_at).total_seconds(), 3),
+            },
+        )
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                sent = self.relay_once()
+            except Exception:
+                self.errors += 1
+                logger.exception("Outbox relay pass failed")
+                sent = 0
+            # Keep going straight away while there is a full backlog, otherwise poll
+            if sent < self._batch_size:
+                self._stopping.wait(self._poll_interval)
+
+
+relay = OutboxRelay(
+    database.SessionLocal,
+    pika_client.publisher,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    confirm_timeout=settings.OUTBOX_CONFIRM_TIMEOUT,
+)
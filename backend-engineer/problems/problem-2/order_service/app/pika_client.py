@@ -1,28 +1,190 @@
+import logging
 import pika
-import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 from shared.app.settings import Settings
 
 settings = Settings()
+logger = logging.getLogger(__name__)
 
-def publish_order_created(order_id, items):
-    try:
-        connection = pika.BlockingConnection(pika.URLParameters(settings.RABBITMQ_URL))
-        channel = connection.channel()
-        channel.queue_declare(queue='order_created_queue', durable=True)
-        
-        message_body = {
-            "id": order_id,
-            "items": [item.model_dump() for item in items]
+ORDER_CREATED_QUEUE = 'order_created_queue'
+
+
+class PublisherBackpressure(Exception):
+    """Raised (via the returned future) when the pending buffer is full."""
+
+
+class OrderEventPublisher:
+    """
+    Keeps a single RabbitMQ connection open on a dedicated thread.
+
+    Callers hand messages over with `publish()`, which never blocks: it returns a
+    `concurrent.futures.Future` that resolves once the broker confirms the message.
+    The publisher thread drains the pending buffer in batches, publishes with
+    confirms enabled, and reconnects on its own when the broker goes away.
+    """
+
+    def __init__(self, url, max_pending, batch_size, reconnect_delay):
+        self._parameters = pika.URLParameters(url)
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._retry = deque()
+        self._batch_size = batch_size
+        self._reconnect_delay = reconnect_delay
+        self._stopping = threading.Event()
+        self._thread = None
+        self._connection = None
+        self._channel = None
+
+        self.connected = False
+        self.published = 0
+        self.failed = 0
+        self.rejected = 0
+        self.reconnects = 0
+        self.batches = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="order-event-publisher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        # Anything still buffered will never be sent by this process
+        for *_, future in self._take_all():
+            if not future.done():
+                future.set_exception(RuntimeError("Publisher stopped before the message was sent"))
+
+    def publish(self, body: str, headers=None) -> Future:
+        future = Future()
+        try:
+            self._pending.put_nowait((body, headers, future))
+        except queue.Full:
+            self.rejected += 1
+            future.set_exception(PublisherBackpressure(f"{self._pending.maxsize} messages already pending"))
+        return future
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "pending": self._pending.qsize() + len(self._retry),
+            "max_pending": self._pending.maxsize,
+            "published": self.published,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "reconnects": self.reconnects,
+            "batches": self.batches,
         }
-        
-        channel.basic_publish(
-            exchange='',
-            routing_key='order_created_queue',
-            body=json.dumps(message_body),
-            properties=pika.BasicProperties(
-                delivery_mode=2,  # make message persistent
-            ))
-        print(f"Order Service: Sent 'order_created' event for order ID: {order_id}")
-        connection.close()
-    except Exception as e:
-        print(f"Order Service: FAILED to send message to RabbitMQ: {e}")
\ No newline at end of file
+
+    # --- Publisher thread ---
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self._connect()
+                self._drain()
+            except pika.exceptions.AMQPError as e:
+                logger.warning("RabbitMQ publisher connection lost", extra={"error": str(e)})
+            except Exception:
+                logger.exception("RabbitMQ publisher crashed")
+            finally:
+                self._close()
+            if not self._stopping.is_set():
+                self.reconnects += 1
+                time.sleep(self._reconnect_delay)
+
+    def _connect(self):
+        self._connection = pika.BlockingConnection(self._parameters)
+        self._channel = self._connection.channel()
+        self._channel.queue_declare(queue=ORDER_CREATED_QUEUE, durable=True)
+        self._channel.confirm_delivery()
+        self.connected = True
+        logger.info("RabbitMQ publisher connected")
+
+    def _close(self):
+        self.connected = False
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except pika.exceptions.AMQPError:
+            pass
+        self._connection = None
+        self._channel = None
+
+    def _drain(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            else:
+                # Idle: keep heartbeats flowing so the broker doesn't drop us
+                self._connection.process_data_events(time_limit=0)
+        # Flush whatever was queued before shutdown was requested
+        leftovers = self._take_all()
+        if leftovers:
+            self._flush(leftovers)
+
+    def _next_batch(self):
+        batch = []
+        while self._retry and len(batch) < self._batch_size:
+            batch.append(self._retry.popleft())
+        if not batch:
+            try:
+                batch.append(self._pending.get(timeout=0.5))
+            except queue.Empty:
+                return batch
+        while len(batch) < self._batch_size:
+            try:
+                batch.append(self._pending.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        self.batches += 1
+        for index, (body, headers, future) in enumerate(batch):
+            try:
+                self._channel.basic_publish(
+                    exchange='',
+                    routing_key=ORDER_CREATED_QUEUE,
+                    body=body,
+                    properties=pika.BasicProperties(
+                        delivery_mode=2,  # make message persistent
+                        headers=headers,
+                    ),
+                    mandatory=True,
+                )
+            except (pika.exceptions.NackError, pika.exceptions.UnroutableError) as e:
+                # The broker refused this message; the connection itself is fine
+                self.failed += 1
+                future.set_exception(e)
+                continue
+            except pika.exceptions.AMQPError:
+                # Connection dropped mid-batch: keep the unsent tail for after the reconnect
+                self._retry.extend(batch[index:])
+                raise
+            self.published += 1
+            future.set_result(True)
+
+    def _take_all(self):
+        items = list(self._retry)
+        self._retry.clear()
+        while True:
+            try:
+                items.append(self._pending.get_nowait())
+            except queue.Empty:
+                return items
+
+
+publisher = OrderEventPublisher(
+    settings.RABBITMQ_URL,
+    max_pending=settings.RABBITMQ_PUBLISHER_MAX_PENDING,
+    batch_size=settings.RABBITMQ_PUBLISHER_BATCH_SIZE,
+    reconnect_delay=settings.RABBITMQ_RECONNECT_DELAY,
+)
+
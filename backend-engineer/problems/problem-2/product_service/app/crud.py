@@ -1,10 +1,23 @@
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from . import models
 from shared.app import schemas
 
+logger = logging.getLogger(__name__)
+
 def get_product(db: Session, product_id: int):
     return db.query(models.Product).filter(models.Product.id == product_id).first()
 
+def get_products(db: Session, product_ids: List[int]):
+    # Single IN (...) lookup so callers can resolve a whole cart in one round trip
+    return db.query(models.Product).filter(models.Product.id.in_(product_ids)).all()
+
 def create_product(db: Session, product: schemas.ProductCreate):
     db_product = models.Product(**product.model_dump())
     db.add(db_product)
@@ -13,16 +26,167 @@ def create_product(db: Session, product: schemas.ProductCreate):
     return db_product
 
 def decrease_product_quantity(db: Session, product_id: int, quantity_to_decrease: int):
-
+    # Runs inside the caller's transaction; the caller commits once per order
     db_product = db.query(models.Product).filter(models.Product.id == product_id).with_for_update().first()
     
     if db_product and db_product.quantity >= quantity_to_decrease:
         db_product.quantity -= quantity_to_decrease
-        db.commit()
+        return True
     elif db_product:
-        db.rollback()
-        # In a real app, you would log this error or send a failure event.
-        print(f"ERROR: Not enough stock for product ID {product_id}.")
+        logger.warning(
+            "Not enough stock for inventory update",
+            extra={"product_id": product_id, "quantity": quantity_to_decrease, "available": db_product.quantity},
+        )
     else:
+        logger.warning("Product not found for inventory update", extra={"product_id": product_id})
+    return False
+
+def claim_orders(db: Session, order_ids: List[int]):
+    """
+    Records order ids in the processed-order ledger and returns the ones that were
+    not there yet. Runs in the caller's transaction, so the claim commits (or rolls
+    back) together with the stock changes it guards.
+    """
+    if not order_ids:
+        return set()
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = (
+        insert(models.ProcessedOrder)
+        .values([{"order_id": order_id} for order_id in order_ids])
+        .on_conflict_do_nothing(index_elements=[models.ProcessedOrder.order_id])
+        .returning(models.ProcessedOrder.order_id)
+    )
+    return {row[0] for row in db.execute(stmt)}
+
+def _quantity_values(quantities: Dict[int, int]):
+    # Renders {product_id: quantity} as a VALUES list with bind parameters, used as
+    # the CTE v(id, q); that form works on PostgreSQL and SQLite alike
+    params = {}
+    rows = []
+    for index, product_id in enumerate(sorted(quantities)):
+        params[f"id_{index}"] = product_id
+        params[f"q_{index}"] = quantities[product_id]
+        rows.append(f"(CAST(:id_{index} AS INTEGER), CAST(:q_{index} AS INTEGER))")
+    return ", ".join(rows), params
+
+def _lock_products(db: Session, product_ids):
+    # Lock in id order so concurrent batches can't deadlock on overlapping products.
+    # FOR UPDATE is left out on SQLite, which locks the whole database on write anyway
+    db.execute(
+        select(models.Product.id)
+        .where(models.Product.id.in_(product_ids))
+        .order_by(models.Product.id)
+        .with_for_update()
+    )
+
+def decrease_product_quantities(db: Session, quantities: Dict[int, int]):
+    """
+    Decrements stock for many products with one UPDATE ... FROM a VALUES list.
+    Each row is only touched if it still has enough stock; returns the ids that were
+    updated. The caller owns the transaction and decides whether to commit.
+    """
+    values, params = _quantity_values(quantities)
+    _lock_products(db, sorted(quantities))
+    result = db.execute(
+        text(
+            f"WITH v(id, q) AS (VALUES {values}) "
+            "UPDATE products SET quantity = products.quantity - v.q "
+            "FROM v "
+            "WHERE products.id = v.id AND products.quantity >= v.q "
+            "RETURNING products.id"
+        ),
+        params,
+    )
+    return {row[0] for row in result}
+
+def increase_product_quantities(db: Session, quantities: Dict[int, int]):
+    values, params = _quantity_values(quantities)
+    _lock_products(db, sorted(quantities))
+    db.execute(
+        text(
+            f"WITH v(id, q) AS (VALUES {values}) "
+            "UPDATE products SET quantity = products.quantity + v.q "
+            "FROM v "
+            "WHERE products.id = v.id"
+        ),
+        params,
+    )
+
+# Reservation CRUD
+def get_reservation(db: Session, reservation_id: str):
+    return db.query(models.Reservation).filter(models.Reservation.id == reservation_id).first()
+
+def reserve_stock(db: Session, quantities: Dict[int, int], ttl_seconds: int):
+    """
+    Atomically holds stock for every product in `quantities`. Returns
+    (reservation, []) on success, or (None, product_ids_short_of_stock) after rolling
+    back if any product can't cover its quantity.
+    """
+    updated = decrease_product_quantities(db, quantities)
+    if updated != set(quantities):
         db.rollback()
-        print(f"ERROR: Product with ID {product_id} not found for inventory update.")
\ No newline at end of file
+        return None, sorted(set(quantities) - updated)
+
+    db_reservation = models.Reservation(
+        id=uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds),
+        items=[
+            models.ReservationItem(product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+        ],
+    )
+    db.add(db_reservation)
+    db.commit()
+    db.refresh(db_reservation)
+    return db_reservation, []
+
+def _release(db: Session, reservations):
+    quantities = {}
+    for db_reservation in reservations:
+        db_reservation.status = "RELEASED"
+        for item in db_reservation.items:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if quantities:
+        increase_product_quantities(db, quantities)
+
+def release_reservation(db: Session, reservation_id: str):
+    # Only a HELD reservation gives its stock back; releasing twice is a no-op
+    db_reservation = (
+        db.query(models.Reservation)
+        .filter(models.Reservation.id == reservation_id)
+        .with_for_update()
+        .first()
+    )
+    if db_reservation is not None and db_reservation.status == "HELD":
+        _release(db, [db_reservation])
+    db.commit()
+    return db_reservation
+
+def release_expired_reservations(db: Session, limit: int = 500):
+    expired = (
+        db.query(models.Reservation)
+        .filter(models.Reservation.status == "HELD", models.Reservation.expires_at < datetime.utcnow())
+        .order_by(models.Reservation.expires_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    _release(db, expired)
+    db.commit()
+    return len(expired)
+
+def confirm_reservations(db: Session, reservation_ids: List[str]):
+    """
+    Marks HELD reservations as CONFIRMED in the caller's transaction and returns the
+    ids that were confirmed. Anything not returned was released (e.g. expired) in
+    the meantime and no longer holds stock.
+    """
+    if not reservation_ids:
+        return set()
+    result = db.execute(
+        update(models.Reservation)
+        .where(models.Reservation.id.in_(reservation_ids), models.Reservation.status == "HELD")
+        .values(status="CONFIRMED")
+        .returning(models.Reservation.id)
+    )
+    return {row[0] for row in result}
@@ -1,25 +1,88 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-import threading
+from typing import List
 
-from . import crud, database, models, pika_client
-from shared.app import schemas
+from . import crud, database, models, pika_client, reservation_sweeper
+from shared.app import db_pool, schemas, settings
+from shared.app.log import setup_logging
+from shared.app.metrics import MetricsMiddleware, metrics_response
+from shared.app.tracing import TracingMiddleware, setup as setup_tracing
 
 app = FastAPI(title="Product Service")
+settings_obj = settings.Settings()
+setup_logging("product_service", settings_obj)
+setup_tracing("product_service", settings_obj)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+MAX_BATCH_PRODUCT_IDS = 500
 
 @app.on_event("startup")
 async def startup_event():
     database.init_db() 
-    listener_thread = threading.Thread(target=pika_client.start_consuming, daemon=True)
-    listener_thread.start()
+    pika_client.start_consumers()
+    reservation_sweeper.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    reservation_sweeper.stop()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    return db_pool.pool_stats()
 
 @app.post("/products", response_model=schemas.Product, status_code=201)
 def create_product(product: schemas.ProductCreate, db: Session = Depends(database.get_db)):
     return crud.create_product(db=db, product=product)
 
+@app.get("/products", response_model=List[schemas.Product])
+def read_products(ids: List[int] = Query(...), db: Session = Depends(database.get_db)):
+    # Batch lookup (GET /products?ids=1&ids=2); unknown ids are simply absent from the result
+    if len(ids) > MAX_BATCH_PRODUCT_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_PRODUCT_IDS} product IDs per request")
+    return crud.get_products(db, product_ids=list(set(ids)))
+
 @app.get("/products/{product_id}", response_model=schemas.Product)
 def read_product(product_id: int, db: Session = Depends(database.get_db)):
     db_product = crud.get_product(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return db_product
\ No newline at end of file
+    return db_product
+
+# --- Stock Reservations ---
+
+@app.post("/reservations", response_model=schemas.Reservation, status_code=201)
+def create_reservation(reservation: schemas.ReservationCreate, db: Session = Depends(database.get_db)):
+    quantities = {}
+    for item in reservation.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        raise HTTPException(status_code=400, detail="A reservation needs at least one item")
+
+    ttl_seconds = reservation.ttl_seconds or settings_obj.RESERVATION_TTL_SECONDS
+    db_reservation, short = crud.reserve_stock(db, quantities, ttl_seconds=ttl_seconds)
+    if db_reservation is None:
+        known = {product.id for product in crud.get_products(db, product_ids=short)}
+        missing = [product_id for product_id in short if product_id not in known]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Product with ID {missing[0]} not found")
+        raise HTTPException(status_code=409, detail={"message": "Not enough stock", "product_ids": short})
+    return db_reservation
+
+@app.get("/reservations/{reservation_id}", response_model=schemas.Reservation)
+def read_reservation(reservation_id: str, db: Session = Depends(database.get_db)):
+    db_reservation = crud.get_reservation(db, reservation_id=reservation_id)
+    if db_reservation is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return db_reservation
+
+@app.post("/reservations/{reservation_id}/release", response_model=schemas.Reservation)
+def release_reservation(reservation_id: str, db: Session = Depends(database.get_db)):
+    db_reservation = crud.release_reservation(db, reservation_id=reservation_id)
+    if db_reservation is None:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return db_reservation
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float
-from sqlalchemy.orm import declarative_base
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
 
@@ -8,4 +9,26 @@ class Product(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
     price = Column(Float, nullable=False)
-    quantity = Column(Integer, nullable=False)
\ No newline at end of file
+    quantity = Column(Integer, nullable=False)
+
+class ProcessedOrder(Base):
+    # Ledger of order_created events already applied to inventory, keyed by order id
+    __tablename__ = "processed_orders"
+    order_id = Column(Integer, primary_key=True)
+    processed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class Reservation(Base):
+    # Stock held for an order: HELD until the order event confirms it, or RELEASED on
+    # cancellation/expiry (which puts the quantities back)
+    __tablename__ = "reservations"
+    id = Column(String, primary_key=True)
+    status = Column(String, default="HELD", nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)
+    items = relationship("ReservationItem", cascade="all, delete-orphan", lazy="selectin")
+
+class ReservationItem(Base):
+    __tablename__ = "reservation_items"
+    reservation_id = Column(String, ForeignKey("reservations.id"), primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    quantity = Column(Integer, nullable=False)
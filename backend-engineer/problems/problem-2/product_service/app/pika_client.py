@@ -1,46 +1,276 @@
+import logging
 import pika
 import json
+import threading
 import time
+from collections import OrderedDict
+from sqlalchemy.exc import OperationalError
 from . import crud, database
+from shared.app.log import sampled
+from shared.app.metrics import RABBITMQ_CONSUMED
 from shared.app.settings import Settings
+from shared.app.tracing import parse_traceparent, tracer
 
 settings = Settings()
+logger = logging.getLogger(__name__)
 
-def on_message_received(ch, method, properties, body):
-    print("Product Service: Received new message from RabbitMQ", flush=True)
+ORDER_CREATED_QUEUE = 'order_created_queue'
+DEAD_LETTER_QUEUE = 'order_created_dlq'
+
+consumed_processed = RABBITMQ_CONSUMED.labels(ORDER_CREATED_QUEUE, "processed")
+consumed_duplicate = RABBITMQ_CONSUMED.labels(ORDER_CREATED_QUEUE, "duplicate")
+consumed_dead_lettered = RABBITMQ_CONSUMED.labels(ORDER_CREATED_QUEUE, "dead_lettered")
+
+
+class RecentlyProcessed:
+    """Bounded LRU of order ids this process has applied, checked before the ledger table."""
+
+    def __init__(self, capacity):
+        self._capacity = capacity
+        self._order_ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, order_id):
+        with self._lock:
+            if order_id in self._order_ids:
+                self._order_ids.move_to_end(order_id)
+                return True
+            return False
+
+    def add_many(self, order_ids):
+        with self._lock:
+            for order_id in order_ids:
+                self._order_ids[order_id] = None
+                self._order_ids.move_to_end(order_id)
+            while len(self._order_ids) > self._capacity:
+                self._order_ids.popitem(last=False)
+
+
+recently_processed = RecentlyProcessed(settings.CONSUMER_DEDUP_CACHE_SIZE)
+
+def decode_order(body):
+    order_data = json.loads(body)
+    order_data['id'] = int(order_data['id'])
+    return order_data
+
+def dead_letter(ch, body, error):
+    ch.basic_publish(
+        exchange='',
+        routing_key=DEAD_LETTER_QUEUE,
+        body=body,
+        properties=pika.BasicProperties(
+            delivery_mode=2,
+            headers={"x-error": str(error)[:1000]},
+        ))
+    logger.error("Moved message to dead letter queue", extra={"queue": DEAD_LETTER_QUEUE, "error": str(error)})
+
+def apply_order(order_data):
+    """Applies one order in its own transaction; returns False if it was already applied."""
+    order_id = order_data['id']
+    if order_id in recently_processed:
+        return False
+    db_session = database.SessionLocal()
     try:
-        order_data = json.loads(body)
-        db_session = next(database.get_db())
-        
-        print(f"Product Service: Processing inventory update for order ID: {order_data.get('id')}", flush=True)
-        for item in order_data.get('items', []):
-            crud.decrease_product_quantity(db_session, item['product_id'], item['quantity'])
-        
-        print(f"Product Service: Inventory successfully updated for order ID: {order_data.get('id')}", flush=True)
+        if not crud.claim_orders(db_session, [order_id]):
+            db_session.rollback()
+            recently_processed.add_many([order_id])
+            return False
+        reservation_id = order_data.get('reservation_id')
+        # A confirmed reservation already took the stock when the order was placed
+        if not (reservation_id and crud.confirm_reservations(db_session, [reservation_id])):
+            if reservation_id:
+                logger.warning(
+                    "Reservation no longer held, taking stock directly",
+                    extra={"order_id": order_id, "reservation_id": reservation_id},
+                )
+            # Lock rows in id order, like the batched path, so the two can't deadlock
+            for item in sorted(order_data.get('items', []), key=lambda item: item['product_id']):
+                crud.decrease_product_quantity(db_session, item['product_id'], item['quantity'])
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
         db_session.close()
+    recently_processed.add_many([order_id])
+    return True
+
+def apply_batch(orders):
+    """
+    Applies a micro-batch of orders as one transaction: claim the unseen order ids in
+    the ledger, confirm their reservations, then one set-based stock update for the
+    combined quantities of orders without a held reservation. Returns the ids of the
+    orders it applied, or None (after rolling back) if any product lacks stock for
+    the combined quantity.
+    """
+    unseen = {}
+    for order_data in orders:
+        if order_data['id'] not in recently_processed:
+            unseen.setdefault(order_data['id'], order_data)
+    if not unseen:
+        return set()
 
+    db_session = database.SessionLocal()
+    try:
+        claimed = crud.claim_orders(db_session, list(unseen))
+        # Orders placed with a reservation only need it confirmed; the rest (legacy
+        # events, or reservations that expired first) take stock directly
+        confirmed = crud.confirm_reservations(
+            db_session,
+            [unseen[order_id]['reservation_id'] for order_id in claimed if unseen[order_id].get('reservation_id')],
+        )
+        quantities = {}
+        for order_id in claimed:
+            if unseen[order_id].get('reservation_id') in confirmed:
+                continue
+            for item in unseen[order_id].get('items', []):
+                quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+        if quantities and crud.decrease_product_quantities(db_session, quantities) != set(quantities):
+            db_session.rollback()
+            return None
+        db_session.commit()
+    except Exception:
+        db_session.rollback()
+        raise
+    finally:
+        db_session.close()
+    recently_processed.add_many(unseen)
+    logger.info("Inventory updated for a batch of orders", extra=sampled(order_ids=sorted(claimed), batch_size=len(orders)))
+    return claimed
+
+def handle_message(ch, method, body):
+    try:
+        order_data = decode_order(body)
+        if apply_order(order_data):
+            consumed_processed.inc()
+            logger.info(
+                "Inventory updated for order",
+                extra=sampled(
+                    order_id=order_data['id'],
+                    product_ids=[item['product_id'] for item in order_data.get('items', [])],
+                ),
+            )
+        else:
+            consumed_duplicate.inc()
+            logger.info("Order already processed, skipping", extra=sampled(order_id=order_data['id']))
+    except OperationalError:
+        # Database unavailable: leave the message unacked; it is redelivered after the
+        # reconnect and the ledger makes the retry safe.
+        raise
     except Exception as e:
-        print(f"Product Service: FAILED to process message. Error: {e}", flush=True)
+        logger.exception("Failed to process message")
+        dead_letter(ch, body, e)
+        consumed_dead_lettered.inc()
+    ch.basic_ack(delivery_tag=method.delivery_tag)
+
+def consume_span(properties, **attributes):
+    # Continues the trace carried in the message headers by order_service's outbox relay
+    headers = properties.headers or {}
+    return tracer.start_span(
+        f"process {ORDER_CREATED_QUEUE}",
+        kind="consumer",
+        parent=parse_traceparent(headers.get("traceparent")),
+        attributes={"messaging.source": ORDER_CREATED_QUEUE, **attributes},
+    )
+
+def on_message_received(ch, method, properties, body):
+    with consume_span(properties):
+        handle_message(ch, method, body)
+
+def process_batch(ch, batch):
+    """
+    Applies a micro-batch with apply_batch and acks it with a single multiple=True ack.
+    If the batch can't be applied as a whole (stock guard, bad message, error), it is
+    replayed message by message so the outcome per order is the same as in single mode.
+    Every message gets its own consumer span in its own trace, covering the batch.
+    """
+    spans = [consume_span(properties, **{"messaging.batch_size": len(batch)}) for _, properties, _ in batch]
+    try:
+        try:
+            applied = apply_batch([decode_order(body) for _, _, body in batch])
+            if applied is not None:
+                ch.basic_ack(delivery_tag=batch[-1][0].delivery_tag, multiple=True)
+                # Everything else was already applied: in the ledger, or repeated within the batch
+                consumed_processed.inc(len(applied))
+                consumed_duplicate.inc(len(batch) - len(applied))
+                return
+            logger.warning("Batch stock guard failed, replaying orders one by one", extra={"batch_size": len(batch)})
+        except OperationalError:
+            raise
+        except Exception:
+            logger.exception("Failed to process batch, replaying orders one by one", extra={"batch_size": len(batch)})
+        for span, (method, _, body) in zip(spans, batch):
+            with span:
+                handle_message(ch, method, body)
     finally:
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        for span in spans:
+            span.end()
+
+def consume_batches(channel):
+    batch = []
+    batch_started = 0.0
+    for method, properties, body in channel.consume(ORDER_CREATED_QUEUE, inactivity_timeout=settings.CONSUMER_BATCH_TIMEOUT):
+        if method is not None:
+            if not batch:
+                batch_started = time.monotonic()
+            batch.append((method, properties, body))
+        if batch and (
+            method is None
+            or len(batch) >= settings.CONSUMER_BATCH_SIZE
+            or time.monotonic() - batch_started >= settings.CONSUMER_BATCH_TIMEOUT
+        ):
+            process_batch(channel, batch)
+            batch = []
 
-def start_consuming():
+def start_consuming(batched=False):
     while True:
+        connection = None
         try:
-            print("Product Service: Attempting to connect to RabbitMQ...", flush=True)
+            logger.info("Connecting to RabbitMQ")
             connection = pika.BlockingConnection(pika.URLParameters(settings.RABBITMQ_URL))
             channel = connection.channel()
             
-            channel.queue_declare(queue='order_created_queue', durable=True)
-            channel.basic_qos(prefetch_count=1)
-            channel.basic_consume(queue='order_created_queue', on_message_callback=on_message_received)
-            
-            print('Product Service: Started consuming from RabbitMQ. Waiting for messages.', flush=True)
-            channel.start_consuming()
+            channel.queue_declare(queue=ORDER_CREATED_QUEUE, durable=True)
+            channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+            if batched:
+                # A batch can never be larger than what the broker lets us hold unacked
+                channel.basic_qos(prefetch_count=max(settings.CONSUMER_PREFETCH, settings.CONSUMER_BATCH_SIZE))
+                logger.info("Consuming from RabbitMQ", extra={"queue": ORDER_CREATED_QUEUE, "mode": "batched"})
+                consume_batches(channel)
+            else:
+                channel.basic_qos(prefetch_count=settings.CONSUMER_PREFETCH)
+                channel.basic_consume(queue=ORDER_CREATED_QUEUE, on_message_callback=on_message_received)
+                logger.info("Consuming from RabbitMQ", extra={"queue": ORDER_CREATED_QUEUE, "mode": "single"})
+                channel.start_consuming()
 
         except pika.exceptions.AMQPConnectionError as e:
-            print(f"Product Service: Connection to RabbitMQ failed: {e}. Retrying in 5 seconds...", flush=True)
+            logger.warning("Connection to RabbitMQ failed, retrying in 5 seconds", extra={"error": str(e)})
+            time.sleep(5)
+        except Exception:
+            logger.exception("Consumer crashed, retrying in 5 seconds")
             time.sleep(5)
-        except Exception as e:
-            print(f"Product Service: An unexpected error occurred: {e}. Retrying in 5 seconds...", flush=True)
-            time.sleep(5)
\ No newline at end of file
+        finally:
+            # Closing the connection hands any unacked messages back to the broker
+            if connection is not None and connection.is_open:
+                try:
+                    connection.close()
+                except pika.exceptions.AMQPError:
+                    pass
+
+def start_consumers():
+    # pika connections are not thread-safe, so every worker owns its own connection
+    if settings.CONSUMER_MODE == "batched":
+        workers = settings.CONSUMER_WORKERS
+    else:
+        workers = 1
+    threads = []
+    for index in range(workers):
+        thread = threading.Thread(
+            target=start_consuming,
+            kwargs={"batched": settings.CONSUMER_MODE == "batched"},
+            name=f"inventory-consumer-{index}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    return threads
@@ -0,0 +1,32 @@
+import logging
+import threading
+from . import crud, database
+from shared.app.settings import Settings
+
+settings = Settings()
+logger = logging.getLogger(__name__)
+
+_stopping = threading.Event()
+
+def sweep_expired_reservations():
+    # Gives the stock of reservations whose order never confirmed them back to the catalog
+    while not _stopping.wait(settings.RESERVATION_SWEEP_INTERVAL):
+        db_session = database.SessionLocal()
+        try:
+            released = crud.release_expired_reservations(db_session)
+            if released:
+                logger.info("Released expired stock reservations", extra={"released": released})
+        except Exception:
+            db_session.rollback()
+            logger.exception("Failed to release expired reservations")
+        finally:
+            db_session.close()
+
+def start():
+    _stopping.clear()
+    thread = threading.Thread(target=sweep_expired_reservations, name="reservation-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+def stop():
+    _stopping.set()
@@ -0,0 +1,45 @@
+"""
+Micro-benchmark for gateway token verification.
+
+Compares python-jose and PyJWT HS256 verification with a hit in the gateway's
+verified-token cache. Run from problem-2/:
+
+    PYTHONPATH=.:api_gateway python scripts/bench_jwt.py
+"""
+import time
+import timeit
+from datetime import datetime, timedelta
+
+from jose import jwt
+
+from app.auth import VerifiedTokenCache, make_decoder
+
+SECRET = "a_very_secret_key_that_is_shared"
+ROUNDS = 20_000
+
+
+def main():
+    token = jwt.encode(
+        {"sub": "42", "exp": datetime.utcnow() + timedelta(minutes=30)}, SECRET, algorithm="HS256"
+    )
+
+    cache = VerifiedTokenCache(max_entries=10_000, max_ttl=300)
+    cache.put(token, 42, exp=time.time() + 1800)
+
+    candidates = {
+        "python-jose decode": make_decoder("jose", SECRET, ["HS256"]),
+        "PyJWT decode": make_decoder("pyjwt", SECRET, ["HS256"]),
+        "verified-token cache hit": cache.get,
+    }
+
+    print(f"{ROUNDS} verifications each")
+    baseline = None
+    for name, fn in candidates.items():
+        seconds = min(timeit.repeat(lambda: fn(token), number=ROUNDS, repeat=3))
+        per_call_us = seconds / ROUNDS * 1e6
+        baseline = baseline or per_call_us
+        print(f"{name:<28} {per_call_us:8.2f} us/call   {baseline / per_call_us:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
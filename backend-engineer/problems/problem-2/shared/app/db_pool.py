@@ -0,0 +1,123 @@
+import time
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+from .metrics import REGISTRY, instrument_engine
+
+POOL_CHECKOUT_SECONDS = REGISTRY.histogram(
+    "db_pool_checkout_duration_seconds", "Time to check a connection out of the pool", ["engine"]
+)
+POOL_TIMEOUTS = REGISTRY.counter("db_pool_checkout_timeouts_total", "Checkouts that gave up waiting", ["engine"])
+POOL_OVERFLOW_OPENED = REGISTRY.counter(
+    "db_pool_overflow_opened_total", "Connections opened beyond pool_size", ["engine"]
+)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    Times every checkout (waiting for a free connection, opening one, pre-ping)
+    and counts checkout timeouts. Connections opened beyond pool_size are
+    counted by a connect listener (see _count_overflow_opened). Pool
+    state itself (size, checked out, overflow) is read live from the pool.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The engine name arrives as pool_logging_name, which also survives recreate()
+        name = self.logging_name or "default"
+        self.checkout_seconds = POOL_CHECKOUT_SECONDS.labels(name)
+        self.timeouts = POOL_TIMEOUTS.labels(name)
+        self.overflow_opened = POOL_OVERFLOW_OPENED.labels(name)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.timeouts.inc()
+            raise
+        self.checkout_seconds.observe(time.perf_counter() - started)
+        return connection
+
+
+_engines = {}
+
+
+def _count_overflow_opened(engine):
+    """Counts each connection the pool opens while it is past pool_size, from its connect event."""
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        # A recycled or invalidated connection reconnects on the same entry; count each entry once
+        if "overflow_counted" in connection_record.record_info:
+            return
+        connection_record.record_info["overflow_counted"] = True
+        # engine.pool, not a captured pool: dispose() swaps in a new one that keeps this listener
+        pool = engine.pool
+        # overflow() counts up from -pool_size: above zero the pool is past pool_size
+        if isinstance(pool, InstrumentedQueuePool) and pool.overflow() > 0:
+            pool.overflow_opened.inc()
+
+
+def engine_options(name, url, settings):
+    """create_engine keyword arguments for the DB_POOL_* / DB_STATEMENT_TIMEOUT_MS settings."""
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_logging_name": name,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    timeout_ms = settings.DB_STATEMENT_TIMEOUT_MS
+    if timeout_ms and make_url(url).get_backend_name() == "postgresql":
+        # Sent as a startup parameter, so it costs no extra round trip per connection
+        options["connect_args"] = {"options": f"-c statement_timeout={timeout_ms}"}
+    return options
+
+
+def create_instrumented_engine(name, url, settings):
+    """Creates an engine with the configured pool and registers it under `name` for `pool_stats()`."""
+    engine = create_engine(url, **engine_options(name, url, settings))
+    instrument_engine(engine, name)
+    _count_overflow_opened(engine)
+    _engines[name] = engine
+    return engine
+
+
+def pool_stats():
+    """Live pool state and checkout counters for every registered engine."""
+    result = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        entry = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+        }
+        if isinstance(pool, InstrumentedQueuePool):
+            buckets, seconds = pool.checkout_seconds.snapshot()
+            entry.update(
+                checkouts=buckets[-1],
+                checkout_seconds_total=seconds,
+                timeouts=pool.timeouts.value(),
+                overflow_opened=pool.overflow_opened.value(),
+            )
+        result[name] = entry
+    return result
+
+
+def collect_pool_state():
+    # Live pool state for /metrics; the checkout counters are regular metrics above
+    stats = pool_stats()
+    for key, help in (
+        ("size", "Configured pool_size"),
+        ("checked_out", "Connections currently checked out"),
+        ("overflow", "Connections open beyond pool_size"),
+    ):
+        yield f"db_pool_{key}", "gauge", help, [({"engine": name}, entry[key]) for name, entry in stats.items()]
+
+
+REGISTRY.register_collector("db_pool", collect_pool_state)
@@ -0,0 +1,135 @@
+"""
+Structured logging shared by every service.
+
+Records are handed to a bounded in-memory queue and written to stdout as JSON
+lines by a background listener thread, so a log call on a request or consumer
+path never blocks on I/O. If the queue is full the record is dropped and counted
+rather than stalling the caller.
+
+Per-message INFO lines on hot paths pass `extra=sampled(...)` and only
+LOG_SAMPLE_RATE of them are kept; warnings and errors are always kept. Other
+`extra` fields (order_id, product_id, ...) become JSON fields.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+from . import tracing
+from .metrics import REGISTRY
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sampled"}
+
+_listener = None
+
+
+def sampled(**fields):
+    """`extra` for a high-volume INFO line that may be sampled out."""
+    return {"sampled": True, **fields}
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps `rate` of the sampled records below WARNING and stamps the rate on them."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        if self.rate < 1.0 and random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that drops (and counts) records when the queue is full. The
+    record is flattened in the calling thread, where the trace context lives; the
+    JSON encoding and the write happen on the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        span = tracing.current_span()
+        if span is not None:
+            record.trace_id = span.context.trace_id
+            record.span_id = span.context.span_id
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(service, settings):
+    """
+    Routes the root logger through the queue for this process. Safe to call more
+    than once; only the first call installs anything.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter(service))
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    root.addHandler(queue_handler)
+    # httpx logs every request at INFO; upstream calls are already traced and measured
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    # Flush whatever is still queued when the process exits
+    atexit.register(_listener.stop)
+
+    REGISTRY.register_collector("log", lambda: [
+        ("log_records_dropped_total", "counter", "Log records dropped because the queue was full", [({}, queue_handler.dropped)]),
+        ("log_queue_depth", "gauge", "Log records waiting to be written", [({}, log_queue.qsize())]),
+    ])
@@ -0,0 +1,358 @@
+"""
+In-process metrics in the Prometheus text format, served at /metrics.
+
+Updates are lock-free: each metric keeps per-thread slots that only the owning
+thread (the event loop or a threadpool worker) writes, and a scrape sums them.
+A scrape can miss an update that is in flight but never loses or corrupts one,
+and the hot path is a thread-local lookup plus an add.
+
+Each problem is a separate project, so this module is copied into each one
+rather than shared. Keep the copies identical. Only a service's own metrics,
+appended after the "Database" section, may differ.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+
+from fastapi.responses import Response
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class _Shards:
+    """A fixed number of values, with one private copy per writing thread."""
+
+    __slots__ = ("_size", "_local", "_all")
+
+    def __init__(self, size):
+        self._size = size
+        self._local = threading.local()
+        self._all = []
+
+    def mine(self):
+        slots = getattr(self._local, "slots", None)
+        if slots is None:
+            slots = self._local.slots = [0] * self._size
+            self._all.append(slots)  # list.append is atomic under the GIL
+        return slots
+
+    def totals(self):
+        totals = [0] * self._size
+        for slots in list(self._all):
+            for i, value in enumerate(slots):
+                totals[i] += value
+        return totals
+
+
+class _CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount=1):
+        self._shards.mine()[0] += amount
+
+    def value(self):
+        return self._shards.totals()[0]
+
+
+class _GaugeChild(_CounterChild):
+    # Only relative updates: an absolute value belongs in a collector
+    __slots__ = ()
+
+    def dec(self, amount=1):
+        self._shards.mine()[0] -= amount
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_shards")
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+        # One slot per bucket, one for +Inf, and the running sum
+        self._shards = _Shards(len(buckets) + 2)
+
+    def observe(self, value):
+        slots = self._shards.mine()
+        slots[bisect.bisect_left(self._buckets, value)] += 1
+        slots[-1] += value
+
+    def snapshot(self):
+        """(cumulative bucket counts ending with +Inf, sum)"""
+        totals = self._shards.totals()
+        cumulative, running = [], 0
+        for count in totals[:-1]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-1]
+
+
+class _Family:
+    """A metric name with its children, one per combination of label values."""
+
+    def __init__(self, name, help, kind, labelnames, make_child, buckets=None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._make_child = make_child
+        self._children = {}
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, self._make_child())
+        return child
+
+    # Shortcuts for metrics without labels
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def children(self):
+        return list(self._children.items())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._collectors = {}
+
+    def _family(self, name, help, kind, labelnames, make_child, buckets=None):
+        # Re-registering a name returns the existing family, so importing a module
+        # twice can't split one metric in two
+        family = self._families.get(name)
+        if family is None:
+            family = self._families.setdefault(name, _Family(name, help, kind, labelnames, make_child, buckets))
+        return family
+
+    def counter(self, name, help, labelnames=()):
+        return self._family(name, help, "counter", labelnames, _CounterChild)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._family(name, help, "gauge", labelnames, _GaugeChild)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        buckets = tuple(buckets)
+        return self._family(name, help, "histogram", labelnames, lambda: _HistogramChild(buckets), buckets)
+
+    def register_collector(self, key, collect):
+        """
+        `collect()` yields (name, kind, help, [(labels dict, value), ...]) at scrape
+        time, for values another object already tracks (pool state, queue depths).
+        """
+        self._collectors[key] = collect
+
+    def render(self):
+        lines = []
+        for family in list(self._families.values()):
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in family.children():
+                labels = dict(zip(family.labelnames, values))
+                if family.kind == "histogram":
+                    cumulative, total = child.snapshot()
+                    for bound, count in zip(family.buckets + ("+Inf",), cumulative):
+                        lines.append(f"{family.name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+                    lines.append(f"{family.name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{family.name}_count{_format_labels(labels)} {cumulative[-1]}")
+                else:
+                    lines.append(f"{family.name}{_format_labels(labels)} {child.value()}")
+        for collect in list(self._collectors.values()):
+            for name, kind, help, samples in collect():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def metrics_response():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def stats_collector(namespace, stats, counters=()):
+    """
+    Exposes an existing `stats()` dict: keys listed in `counters` become
+    `<namespace>_<key>_total` counters, other numeric keys gauges.
+    """
+    def collect():
+        for key, value in stats().items():
+            if isinstance(value, bool):
+                value = int(value)
+            if not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                yield f"{namespace}_{key}_total", "counter", f"{namespace} {key}", [({}, value)]
+            else:
+                yield f"{namespace}_{key}", "gauge", f"{namespace} {key}", [({}, value)]
+    return collect
+
+
+# --- HTTP ---
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to complete a request, body included", ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requests currently being served")
+HTTP_REQUEST_DB_STATEMENTS = REGISTRY.histogram(
+    "http_request_db_statements", "SQL statements executed per request", ["route"], buckets=COUNT_BUCKETS
+)
+HTTP_REQUEST_DB_SECONDS = REGISTRY.histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request", ["route"]
+)
+
+# [statements, seconds] for the request being served; see instrument_engine
+_request_db = ContextVar("request_db", default=None)
+# endpoint -> route template, for Starlette versions that don't put the route in the scope
+_endpoint_paths = {}
+
+
+def route_template(scope):
+    """The matched route's template (/orders/{id}) once routing has run, else "unmatched"."""
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _endpoint_paths.get(endpoint)
+    if path is None:
+        for candidate in scope["app"].routes:
+            if getattr(candidate, "endpoint", None) is endpoint:
+                path = _endpoint_paths[endpoint] = candidate.path
+                break
+        else:
+            return "unmatched"
+    return path
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording per-route latency, in-flight requests and the
+    SQL each request ran. Routes are labelled by their template (/orders/{id}),
+    never the raw path, so label cardinality stays bounded. Services without a
+    database pass `track_db=False`.
+    """
+
+    def __init__(self, app, track_db=True):
+        self.app = app
+        self.track_db = track_db
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        db_usage = [0, 0.0]
+        token = _request_db.set(db_usage)
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            _request_db.reset(token)
+            route = route_template(scope)
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route, status).observe(elapsed)
+            if self.track_db:
+                HTTP_REQUEST_DB_STATEMENTS.labels(route).observe(db_usage[0])
+                HTTP_REQUEST_DB_SECONDS.labels(route).observe(db_usage[1])
+
+
+# --- Database ---
+
+DB_STATEMENTS = REGISTRY.counter("db_statements_total", "SQL statements executed", ["engine"])
+DB_STATEMENT_SECONDS = REGISTRY.histogram("db_statement_duration_seconds", "Time to execute one SQL statement", ["engine"])
+
+
+def instrument_engine(engine, name):
+    """Counts and times every statement on `engine`, globally and for the current request."""
+    statements = DB_STATEMENTS.labels(name)
+    durations = DB_STATEMENT_SECONDS.labels(name)
+    # An AsyncEngine only accepts event listeners through its sync_engine
+    engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+        statements.inc()
+        durations.observe(elapsed)
+        db_usage = _request_db.get()
+        if db_usage is not None:
+            db_usage[0] += 1
+            db_usage[1] += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        started = exception_context.connection.info.get("metrics_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+
+# --- Upstream HTTP calls ---
+
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Time until an upstream's response headers arrive", ["upstream", "status"]
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "upstream_request_errors_total", "Upstream calls that failed without a response", ["upstream", "error"]
+)
+
+
+def instrument_httpx(client, upstream):
+    """Times every request `client` sends, labelled with `upstream` and the response status."""
+    async def on_request(request):
+        request.extensions["metrics_started"] = time.perf_counter()
+
+    async def on_response(response):
+        started = response.request.extensions.get("metrics_started")
+        if started is not None:
+            UPSTREAM_SECONDS.labels(upstream, response.status_code).observe(time.perf_counter() - started)
+
+    client.event_hooks["request"].append(on_request)
+    client.event_hooks["response"].append(on_response)
+    return client
+
+
+# --- RabbitMQ ---
+
+RABBITMQ_CONSUMED = REGISTRY.counter("rabbitmq_consumed_total", "Messages consumed, by outcome", ["queue", "result"])
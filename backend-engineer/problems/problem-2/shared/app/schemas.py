@@ -1,4 +1,5 @@
-from pydantic import BaseModel, EmailStr
+from datetime import datetime
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional
 
 # --- User Schemas ---
@@ -28,7 +29,8 @@ class Product(ProductBase):
 # --- Order Schemas ---
 class OrderItemCreate(BaseModel):
     product_id: int
-    quantity: int
+    # A zero or negative quantity would pass the stock check and add stock instead
+    quantity: int = Field(gt=0)
 
 class OrderCreate(BaseModel):
     items: List[OrderItemCreate]
@@ -41,6 +43,18 @@ class Order(BaseModel):
     items: List[OrderItemCreate] = []
     model_config = {'from_attributes': True}
 
+# --- Reservation Schemas ---
+class ReservationCreate(BaseModel):
+    items: List[OrderItemCreate]
+    ttl_seconds: Optional[int] = Field(default=None, gt=0)
+
+class Reservation(BaseModel):
+    id: str
+    status: str
+    expires_at: datetime
+    items: List[OrderItemCreate] = []
+    model_config = {'from_attributes': True}
+
 # --- Token Schemas ---
 class Token(BaseModel):
     access_token: str
@@ -0,0 +1,284 @@
+"""
+Distributed tracing with W3C `traceparent` propagation.
+
+The gateway starts a trace for every request. Its context travels to the other
+services in the `traceparent` HTTP header, and to the inventory consumer in the
+AMQP message headers, with a stop in the order outbox table on the way. Each
+service records spans for its own part of the work and hands finished spans to
+a pluggable exporter: none, in-memory (tests) or a JSON-lines file.
+"""
+import json
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+import httpx
+
+from .metrics import route_template
+
+TRACEPARENT = "traceparent"
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class SpanContext(NamedTuple):
+    trace_id: str
+    span_id: str
+    sampled: bool
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value) -> Optional[SpanContext]:
+    """The context in a `traceparent` header, or None if it is missing or malformed."""
+    if isinstance(value, bytes):
+        value = value.decode("latin-1")
+    match = _TRACEPARENT_RE.match(value.strip().lower()) if isinstance(value, str) else None
+    if match is None:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return SpanContext(trace_id, span_id, bool(int(flags, 16) & 1))
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """
+    One timed operation. Use it as a context manager to make it the current span
+    (children and outgoing calls then pick it up), or call `end()` yourself.
+    """
+
+    __slots__ = ("_tracer", "name", "context", "parent_id", "kind", "attributes", "start_time", "end_time", "error", "_token")
+
+    def __init__(self, tracer, name, context, parent_id, kind, attributes):
+        self._tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.error = error if isinstance(error, str) else f"{type(error).__name__}: {error}"
+
+    def end(self):
+        # Idempotent, so a span can be ended both explicitly and by its context manager
+        if self.end_time is None:
+            self.end_time = time.time()
+            if self.context.sampled:
+                self._tracer.export(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "service": self._tracer.service,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_time,
+            "duration_ms": round((self.end_time - self.start_time) * 1000, 3),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and self.error is None:
+            self.set_error(exc)
+        _current_span.reset(self._token)
+        self.end()
+        return False
+
+
+class NoopExporter:
+    def export(self, span):
+        pass
+
+
+class InMemoryExporter:
+    """Keeps finished spans as dicts; for tests and local debugging."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span.to_dict())
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+
+class FileExporter:
+    """Appends one JSON object per finished span to `path`."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, span):
+        line = json.dumps(span.to_dict())
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+def build_exporter(settings):
+    if settings.TRACING_EXPORTER == "none":
+        return NoopExporter()
+    if settings.TRACING_EXPORTER == "memory":
+        return InMemoryExporter()
+    if settings.TRACING_EXPORTER == "file":
+        return FileExporter(settings.TRACING_FILE)
+    raise ValueError(f"Unknown tracing exporter: {settings.TRACING_EXPORTER}")
+
+
+class Tracer:
+    def __init__(self, service="unknown", exporter=None, sample_ratio=1.0):
+        self.service = service
+        self.exporter = exporter or NoopExporter()
+        self.sample_ratio = sample_ratio
+
+    def configure(self, service, exporter, sample_ratio=1.0):
+        self.service = service
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    def start_span(self, name, kind="internal", parent=None, attributes=None):
+        """
+        Starts a span under `parent` (a SpanContext), else under the current span,
+        else as the root of a new trace. Only roots make a sampling decision;
+        everything below inherits it, so a trace is recorded whole or not at all.
+        """
+        if parent is None:
+            current = _current_span.get()
+            parent = current.context if current is not None else None
+        if parent is None:
+            context = SpanContext(_new_id(128), _new_id(64), random.random() < self.sample_ratio)
+            parent_id = None
+        else:
+            context = SpanContext(parent.trace_id, _new_id(64), parent.sampled)
+            parent_id = parent.span_id
+        return Span(self, name, context, parent_id, kind, attributes)
+
+    def export(self, span):
+        try:
+            self.exporter.export(span)
+        except Exception:
+            # Losing a span must never fail the operation it describes
+            pass
+
+
+tracer = Tracer()
+
+
+def setup(service, settings):
+    """Names this process's spans and installs the exporter chosen by TRACING_* settings."""
+    tracer.configure(service, build_exporter(settings), settings.TRACING_SAMPLE_RATIO)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_traceparent():
+    """The current span's `traceparent`, for carrying the trace through storage or a queue."""
+    span = _current_span.get()
+    return span.context.traceparent() if span is not None else None
+
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware wrapping each request in a server span named after its
+    route template. Services continue the caller's trace from `traceparent`; the
+    gateway passes `accept_incoming=False` so every trace starts there. Metrics
+    scrapes are not traced.
+    """
+
+    def __init__(self, app, accept_incoming=True, skip_prefix="/metrics"):
+        self.app = app
+        self.accept_incoming = accept_incoming
+        self.skip_prefix = skip_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        parent = None
+        if self.accept_incoming:
+            for key, value in scope["headers"]:
+                if key == b"traceparent":
+                    parent = parse_traceparent(value)
+                    break
+        span = tracer.start_span(
+            scope["method"], kind="server", parent=parent, attributes={"http.method": scope["method"], "http.target": scope["path"]}
+        )
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = route_template(scope)
+                span.name = f"{scope['method']} {route}"
+                span.set_attribute("http.route", route)
+                span.set_attribute("http.status_code", status)
+                if status >= 500 and span.error is None:
+                    span.set_error(f"HTTP {status}")
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps an httpx transport so every outgoing request gets a client span and
+    carries it in `traceparent`. The span ends when the response headers arrive,
+    or with the error if none do.
+    """
+
+    def __init__(self, transport, upstream):
+        self._transport = transport
+        self._upstream = upstream
+
+    async def handle_async_request(self, request):
+        span = tracer.start_span(
+            f"{request.method} {self._upstream}",
+            kind="client",
+            attributes={"http.method": request.method, "http.target": request.url.path, "peer.service": self._upstream},
+        )
+        with span:
+            request.headers[TRACEPARENT] = span.context.traceparent()
+            response = await self._transport.handle_async_request(request)
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.set_error(f"HTTP {response.status_code}")
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,48 @@
+import importlib
+import os
+import sys
+
+import pytest
+from sqlalchemy import event
+
+# Unit tests run each service in-process against SQLite, with no broker or Postgres
+# Cheap hashes for the suite; must be set before a service's security module is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Keep finished spans in memory so the tracing tests can inspect them
+os.environ["TRACING_EXPORTER"] = "memory"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def load_service(service, database_path):
+    """
+    Imports `service`'s `app` package fresh, pointed at a new SQLite database.
+    Every service names its package `app`, so the previous one is dropped first.
+    """
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    for name in [name for name in sys.modules if name == "app" or name.startswith("app.")]:
+        del sys.modules[name]
+    sys.path[:] = [ROOT, os.path.join(ROOT, service)] + [path for path in sys.path if not path.startswith(ROOT)]
+    main = importlib.import_module("app.main")
+    if hasattr(main, "database"):
+        use_sqlite_transactions(main.database.engine)
+        importlib.import_module("app.models").Base.metadata.create_all(bind=main.database.engine)
+    return main
+
+
+def use_sqlite_transactions(engine):
+    # pysqlite only opens a transaction before a statement that starts with INSERT,
+    # UPDATE or DELETE, so WITH ... UPDATE would autocommit and survive a rollback.
+    # SQLAlchemy's recipe: turn that off and emit BEGIN ourselves
+    @event.listens_for(engine, "connect")
+    def disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def emit_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="module")
+def tmp_database(tmp_path_factory):
+    return tmp_path_factory.mktemp("db") / "test.db"
@@ -0,0 +1,166 @@
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from .conftest import load_service
+
+
+@pytest.fixture(scope="module")
+def gateway(tmp_database):
+    return load_service("api_gateway", tmp_database)
+
+
+@pytest.fixture
+def upstream(gateway, monkeypatch):
+    """One stub app behind every upstream, reached over httpx.ASGITransport; records what it got."""
+    received = []
+    app = FastAPI()
+
+    @app.post("/register")
+    async def register(request: Request):
+        received.append(("/register", request.headers.get("user-id")))
+        return JSONResponse(
+            {"body": (await request.body()).decode(), "traceparent": request.headers.get("traceparent")},
+            status_code=201,
+            headers={"x-upstream": "user_service"},
+        )
+
+    @app.post("/token")
+    async def login(body: dict):
+        received.append(("/token", body["email"]))
+        return {"access_token": "issued", "token_type": "bearer"}
+
+    @app.post("/orders", status_code=201)
+    async def create_order(user_id: str = Header(...)):
+        received.append(("/orders", user_id))
+        return {"user_id": user_id}
+
+    for name, target in gateway.upstreams.items():
+        monkeypatch.setattr(target.client._transport, "_transport", httpx.ASGITransport(app=app))
+    return received
+
+
+@pytest.fixture
+def client(gateway):
+    return TestClient(gateway.app)
+
+
+@pytest.fixture(autouse=True)
+def empty_token_cache(gateway):
+    gateway.token_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def login_limiter(gateway, monkeypatch):
+    limiter = gateway.LoginRateLimiter(
+        gateway.MemoryBucketStore(1000), ip_capacity=4, ip_per_minute=1, username_capacity=2, username_per_minute=1
+    )
+    monkeypatch.setattr(gateway, "login_limiter", limiter)
+    return limiter
+
+
+def token_for(gateway, user_id, expires_in=600):
+    claims = {"sub": str(user_id), "exp": int(time.time()) + expires_in}
+    return jwt.encode(claims, gateway.settings.JWT_SECRET_KEY, algorithm="HS256")
+
+
+def test_request_and_response_pass_through_unchanged(client, upstream):
+    body = '{"email": "a@example.com",  "password": "pw"}'
+
+    response = client.post(
+        "/register", content=body, headers={"Content-Type": "application/json", "user-id": "1"}
+    )
+
+    assert response.status_code == 201
+    assert response.headers["x-upstream"] == "user_service"
+    # The body bytes arrive as sent, not decoded and re-encoded
+    assert response.json()["body"] == body
+    # Gateway-owned headers from the client are never forwarded
+    assert upstream == [("/register", None)]
+
+
+def test_unreachable_upstream_is_a_502(gateway, client, monkeypatch):
+    def refuse(request):
+        raise httpx.ConnectError("connection refused", request=request)
+    transport = gateway.upstreams["user_service"].client._transport
+    monkeypatch.setattr(transport, "_transport", httpx.MockTransport(refuse))
+
+    response = client.post("/register", json={"email": "a@example.com", "password": "pw"})
+
+    assert response.status_code == 502
+
+
+def test_verified_token_is_cached(gateway, client, upstream):
+    # A user-id header from the client is replaced by the one from the token
+    headers = {"Authorization": f"Bearer {token_for(gateway, 7)}", "user-id": "1"}
+    before = gateway.token_cache.stats()
+
+    for _ in range(3):
+        response = client.post("/orders", json={"items": []}, headers=headers)
+        assert response.status_code == 201
+        assert response.json() == {"user_id": "7"}
+
+    after = gateway.token_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 2
+
+
+def test_invalid_and_expired_tokens_are_rejected(gateway, client, upstream):
+    for token in ("not-a-jwt", token_for(gateway, 7, expires_in=-10)):
+        response = client.post("/orders", json={"items": []}, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 401
+    assert gateway.token_cache.stats()["entries"] == 0
+    assert upstream == []
+
+
+def test_login_is_shed_per_account_with_retry_after(client, upstream):
+    credentials = {"email": "Someone@Example.com", "password": "wrong"}
+
+    assert [client.post("/token", json=credentials).status_code for _ in range(2)] == [200, 200]
+    # The same account under different casing shares the bucket
+    response = client.post("/token", json={**credentials, "email": "someone@example.com"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # A shed attempt never reaches user_service
+    assert len(upstream) == 2
+    assert client.post("/token", json={**credentials, "email": "other@example.com"}).status_code == 200
+
+
+def test_login_is_shed_per_client_ip(client, upstream):
+    statuses = [
+        client.post("/token", json={"email": f"user{index}@example.com", "password": "pw"}).status_code
+        for index in range(5)
+    ]
+
+    assert statuses == [200, 200, 200, 200, 429]
+    assert len(upstream) == 4
+
+
+def test_login_without_content_length_is_refused(client, upstream):
+    def chunks():
+        yield b'{"email": "a@example.com", "password": "pw"}'
+
+    response = client.post("/token", content=chunks(), headers={"Content-Type": "application/json"})
+
+    assert response.status_code == 411
+    assert upstream == []
+
+
+def test_gateway_starts_a_new_trace(client, upstream):
+    client_trace = "e" * 32
+
+    response = client.post(
+        "/register",
+        json={"email": "a@example.com", "password": "pw"},
+        headers={"traceparent": f"00-{client_trace}-{'f' * 16}-01"},
+    )
+
+    forwarded = response.json()["traceparent"]
+    assert forwarded is not None
+    assert client_trace not in forwarded
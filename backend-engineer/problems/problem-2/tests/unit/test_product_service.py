@@ -0,0 +1,274 @@
+import json
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from shared.app.tracing import tracer
+
+from .conftest import load_service
+
+
+class FakeChannel:
+    """Records what the consumer acks and dead-letters instead of talking to RabbitMQ."""
+
+    def __init__(self):
+        self.acks = []
+        self.published = []
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append((routing_key, body, properties))
+
+
+def delivery(tag, order, headers=None):
+    body = order if isinstance(order, bytes) else json.dumps(order).encode()
+    return SimpleNamespace(delivery_tag=tag), SimpleNamespace(headers=headers), body
+
+
+@pytest.fixture(scope="module")
+def service(tmp_database):
+    # Built without the lifespan: no consumers, no sweeper thread
+    return load_service("product_service", tmp_database)
+
+
+@pytest.fixture
+def client(service):
+    return TestClient(service.app)
+
+
+@pytest.fixture
+def product(client):
+    def create(quantity):
+        response = client.post("/products", json={"name": "Widget", "price": 2.5, "quantity": quantity})
+        assert response.status_code == 201
+        return response.json()["id"]
+    return create
+
+
+def stock(client, product_id):
+    return client.get(f"/products/{product_id}").json()["quantity"]
+
+
+def test_batch_lookup_returns_the_known_products(service, client, product):
+    first, second = product(1), product(2)
+
+    response = client.get("/products", params={"ids": [second, first, 999999, first]})
+
+    assert response.status_code == 200
+    assert sorted(item["id"] for item in response.json()) == [first, second]
+    too_many = list(range(1, service.MAX_BATCH_PRODUCT_IDS + 2))
+    assert client.get("/products", params={"ids": too_many}).status_code == 400
+
+
+def test_reservation_holds_stock_until_released(client, product):
+    first, second = product(5), product(2)
+
+    response = client.post("/reservations", json={"items": [
+        {"product_id": first, "quantity": 2},
+        {"product_id": second, "quantity": 1},
+        {"product_id": first, "quantity": 1},
+    ]})
+    assert response.status_code == 201
+    reservation = response.json()
+    assert reservation["status"] == "HELD"
+    assert (stock(client, first), stock(client, second)) == (2, 1)
+
+    assert client.post(f"/reservations/{reservation['id']}/release").json()["status"] == "RELEASED"
+    assert (stock(client, first), stock(client, second)) == (5, 2)
+    # Releasing twice gives nothing back a second time
+    client.post(f"/reservations/{reservation['id']}/release")
+    assert (stock(client, first), stock(client, second)) == (5, 2)
+
+
+def test_reservation_short_of_stock_takes_nothing(client, product):
+    plenty, scarce = product(10), product(1)
+
+    response = client.post("/reservations", json={"items": [
+        {"product_id": plenty, "quantity": 3},
+        {"product_id": scarce, "quantity": 2},
+    ]})
+    assert response.status_code == 409
+    assert response.json()["detail"]["product_ids"] == [scarce]
+    assert (stock(client, plenty), stock(client, scarce)) == (10, 1)
+
+    response = client.post("/reservations", json={"items": [{"product_id": 999999, "quantity": 1}]})
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("payload", [
+    {"items": [{"product_id": 1, "quantity": 0}]},
+    {"items": [{"product_id": 1, "quantity": -3}]},
+    {"items": [{"product_id": 1, "quantity": 1}], "ttl_seconds": 0},
+])
+def test_reservation_rejects_invalid_quantities_and_ttl(client, payload):
+    assert client.post("/reservations", json=payload).status_code == 422
+
+
+def test_sweeper_releases_expired_reservations(service, client, product):
+    product_id = product(4)
+    expired = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 3}]}).json()
+    live = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 1}]}).json()
+    assert stock(client, product_id) == 0
+
+    db = service.database.SessionLocal()
+    try:
+        db.get(service.models.Reservation, expired["id"]).expires_at = datetime.utcnow() - timedelta(seconds=1)
+        db.commit()
+        assert service.crud.release_expired_reservations(db) == 1
+        assert service.crud.release_expired_reservations(db) == 0
+    finally:
+        db.close()
+
+    assert stock(client, product_id) == 3
+    assert client.get(f"/reservations/{expired['id']}").json()["status"] == "RELEASED"
+    assert client.get(f"/reservations/{live['id']}").json()["status"] == "HELD"
+
+
+def test_order_event_confirms_its_reservation(service, client, product):
+    product_id = product(5)
+    reservation = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 2}]}).json()
+    channel = FakeChannel()
+
+    method, properties, body = delivery(7, {
+        "id": 1001, "items": [{"product_id": product_id, "quantity": 2}], "reservation_id": reservation["id"],
+    })
+    service.pika_client.on_message_received(channel, method, properties, body)
+
+    assert channel.acks == [(7, False)]
+    assert channel.published == []
+    assert client.get(f"/reservations/{reservation['id']}").json()["status"] == "CONFIRMED"
+    # The reservation already took the stock; confirming it must not take it again
+    assert stock(client, product_id) == 3
+    # A confirmed reservation is neither released nor swept
+    client.post(f"/reservations/{reservation['id']}/release")
+    assert stock(client, product_id) == 3
+
+
+def test_order_event_without_held_reservation_takes_stock(service, client, product):
+    product_id = product(5)
+    reservation = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 2}]}).json()
+    client.post(f"/reservations/{reservation['id']}/release")
+
+    method, properties, body = delivery(1, {
+        "id": 1002, "items": [{"product_id": product_id, "quantity": 2}], "reservation_id": reservation["id"],
+    })
+    service.pika_client.on_message_received(FakeChannel(), method, properties, body)
+
+    assert stock(client, product_id) == 3
+
+
+def test_redelivered_order_is_applied_once(service, client, product, monkeypatch):
+    pika_client = service.pika_client
+    product_id = product(10)
+    order = {"id": 1003, "items": [{"product_id": product_id, "quantity": 4}]}
+    duplicates = pika_client.consumed_duplicate.value()
+    channel = FakeChannel()
+
+    pika_client.on_message_received(channel, *delivery(1, order))
+    pika_client.on_message_received(channel, *delivery(2, order))
+    assert stock(client, product_id) == 6
+
+    # After a restart the in-memory cache is empty; the ledger table still catches it
+    monkeypatch.setattr(pika_client, "recently_processed", pika_client.RecentlyProcessed(100))
+    pika_client.on_message_received(channel, *delivery(3, order))
+
+    assert stock(client, product_id) == 6
+    assert channel.acks == [(1, False), (2, False), (3, False)]
+    assert pika_client.consumed_duplicate.value() - duplicates == 2
+
+
+def test_consumer_span_continues_the_trace_in_the_headers(service, product):
+    product_id = product(1)
+    trace_id, parent_id = "a" * 32, "b" * 16
+    tracer.exporter.clear()
+
+    service.pika_client.on_message_received(FakeChannel(), *delivery(
+        1, {"id": 1004, "items": [{"product_id": product_id, "quantity": 1}]},
+        headers={"traceparent": f"00-{trace_id}-{parent_id}-01"},
+    ))
+
+    [span] = [span for span in tracer.exporter.spans if span["kind"] == "consumer"]
+    assert (span["trace_id"], span["parent_id"]) == (trace_id, parent_id)
+    assert span["name"] == f"process {service.pika_client.ORDER_CREATED_QUEUE}"
+
+
+def test_undecodable_message_is_dead_lettered(service):
+    channel = FakeChannel()
+    dead_lettered = service.pika_client.consumed_dead_lettered.value()
+
+    service.pika_client.on_message_received(channel, *delivery(5, b"not json"))
+
+    assert channel.acks == [(5, False)]
+    [(queue, body, properties)] = channel.published
+    assert (queue, body) == (service.pika_client.DEAD_LETTER_QUEUE, b"not json")
+    assert "x-error" in properties.headers
+    assert service.pika_client.consumed_dead_lettered.value() - dead_lettered == 1
+
+
+def test_batch_applies_each_order_once_and_acks_together(service, client, product):
+    first, second = product(10), product(10)
+    channel = FakeChannel()
+    batch = [
+        delivery(11, {"id": 2001, "items": [{"product_id": first, "quantity": 2}]}),
+        delivery(12, {"id": 2002, "items": [{"product_id": first, "quantity": 1}, {"product_id": second, "quantity": 3}]}),
+        delivery(13, {"id": 2001, "items": [{"product_id": first, "quantity": 2}]}),
+    ]
+
+    service.pika_client.process_batch(channel, batch)
+
+    assert channel.acks == [(13, True)]
+    assert (stock(client, first), stock(client, second)) == (7, 7)
+
+
+def test_batch_short_of_stock_is_replayed_one_by_one(service, client, product):
+    product_id = product(3)
+    channel = FakeChannel()
+    batch = [
+        delivery(21, {"id": 3001, "items": [{"product_id": product_id, "quantity": 2}]}),
+        delivery(22, {"id": 3002, "items": [{"product_id": product_id, "quantity": 2}]}),
+    ]
+
+    service.pika_client.process_batch(channel, batch)
+
+    # The first order fits; the second is recorded but can't take stock it doesn't have
+    assert channel.acks == [(21, False), (22, False)]
+    assert channel.published == []
+    assert stock(client, product_id) == 1
+
+
+def test_batch_confirms_held_reservations_instead_of_taking_stock(service, client, product):
+    product_id = product(10)
+    reservation = client.post("/reservations", json={"items": [{"product_id": product_id, "quantity": 3}]}).json()
+    channel = FakeChannel()
+    batch = [
+        delivery(31, {"id": 4001, "items": [{"product_id": product_id, "quantity": 3}], "reservation_id": reservation["id"]}),
+        delivery(32, {"id": 4002, "items": [{"product_id": product_id, "quantity": 2}]}),
+    ]
+
+    service.pika_client.process_batch(channel, batch)
+
+    assert channel.acks == [(32, True)]
+    assert stock(client, product_id) == 5
+    assert client.get(f"/reservations/{reservation['id']}").json()["status"] == "CONFIRMED"
+
+
+def test_batch_counts_ledger_duplicates_separately(service, client, product):
+    pika_client = service.pika_client
+    product_id = product(10)
+    pika_client.process_batch(FakeChannel(), [delivery(41, {"id": 5001, "items": [{"product_id": product_id, "quantity": 1}]})])
+    processed, duplicates = pika_client.consumed_processed.value(), pika_client.consumed_duplicate.value()
+
+    # 5001 is redelivered alongside one new order and one repeated within the batch
+    pika_client.process_batch(FakeChannel(), [
+        delivery(42, {"id": 5001, "items": [{"product_id": product_id, "quantity": 1}]}),
+        delivery(43, {"id": 5002, "items": [{"product_id": product_id, "quantity": 1}]}),
+        delivery(44, {"id": 5002, "items": [{"product_id": product_id, "quantity": 1}]}),
+    ])
+
+    assert stock(client, product_id) == 8
+    assert pika_client.consumed_processed.value() - processed == 1
+    assert pika_client.consumed_duplicate.value() - duplicates == 2
@@ -0,0 +1,56 @@
+import json
+import logging
+import queue
+
+from shared.app.log import JsonFormatter, NonBlockingQueueHandler, SamplingFilter, sampled
+from shared.app.tracing import tracer
+
+
+def make_record(level=logging.INFO, msg="Inventory updated for order", extra=None):
+    return logging.getLogger("app.pika_client").makeRecord(
+        "app.pika_client", level, __file__, 1, msg, None, None, extra=extra
+    )
+
+
+def test_extra_fields_become_json_fields():
+    record = make_record(extra={"order_id": 7, "product_ids": [1, 2]})
+
+    entry = json.loads(JsonFormatter("product_service").format(record))
+
+    assert entry["service"] == "product_service"
+    assert (entry["level"], entry["logger"], entry["msg"]) == ("INFO", "app.pika_client", "Inventory updated for order")
+    assert (entry["order_id"], entry["product_ids"]) == (7, [1, 2])
+
+
+def test_sampling_only_drops_sampled_info_lines():
+    drop_all = SamplingFilter(0.0)
+
+    assert not drop_all.filter(make_record(extra=sampled(order_id=1)))
+    assert drop_all.filter(make_record())
+    assert drop_all.filter(make_record(logging.WARNING, extra=sampled(order_id=1)))
+
+    kept = make_record(extra=sampled(order_id=1))
+    assert SamplingFilter(1.0).filter(kept)
+    assert kept.sample_rate == 1.0
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+
+    handler.emit(make_record())
+    handler.emit(make_record())
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_record_is_flattened_in_the_calling_thread():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    record = make_record(msg="order %s", extra={"order_id": 7})
+    record.args = (7,)
+
+    with tracer.start_span("consume") as span:
+        prepared = handler.prepare(record)
+
+    assert (prepared.msg, prepared.args) == ("order 7", None)
+    assert (prepared.trace_id, prepared.span_id) == (span.context.trace_id, span.context.span_id)
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from jose import jwt
+from passlib.context import CryptContext
+
+from .conftest import load_service
+
+
+@pytest.fixture(scope="module")
+def service(tmp_database):
+    # One round above the suite default, so hashes made with 4 rounds are outdated
+    previous = os.environ["BCRYPT_ROUNDS"]
+    os.environ["BCRYPT_ROUNDS"] = "5"
+    try:
+        service = load_service("user_service", tmp_database)
+    finally:
+        os.environ["BCRYPT_ROUNDS"] = previous
+    yield service
+    service.password_hasher.shutdown()
+
+
+@pytest.fixture
+def client(service):
+    return TestClient(service.app)
+
+
+def stored_hash(service, email):
+    db = service.database.SessionLocal()
+    try:
+        return service.crud.get_user_by_email(db, email).hashed_password
+    finally:
+        db.close()
+
+
+def test_register_and_log_in(service, client):
+    credentials = {"email": "new@example.com", "password": "a_secure_password123"}
+
+    response = client.post("/register", json=credentials)
+    assert response.status_code == 201
+    user_id = response.json()["id"]
+    assert stored_hash(service, "new@example.com").startswith("$2b$05$")
+
+    assert client.post("/token", json={**credentials, "password": "wrong"}).status_code == 401
+    response = client.post("/token", json=credentials)
+    assert response.status_code == 200
+    claims = jwt.decode(response.json()["access_token"], service.settings_obj.JWT_SECRET_KEY, algorithms=["HS256"])
+    assert claims["sub"] == str(user_id)
+
+
+def test_login_rehashes_an_outdated_hash(service, client):
+    db = service.database.SessionLocal()
+    try:
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("old_password")
+        service.crud.create_user(
+            db, service.schemas.UserCreate(email="old@example.com", password="old_password"), hashed_password=old_hash
+        )
+    finally:
+        db.close()
+
+    assert client.post("/token", json={"email": "old@example.com", "password": "old_password"}).status_code == 200
+
+    new_hash = stored_hash(service, "old@example.com")
+    assert new_hash.startswith("$2b$05$")
+    assert service.password_hasher.context.verify("old_password", new_hash)
+    # Already current: the next login leaves it alone
+    client.post("/token", json={"email": "old@example.com", "password": "old_password"})
+    assert stored_hash(service, "old@example.com") == new_hash
+
+
+def test_saturated_hasher_answers_503(service, client, monkeypatch):
+    saturated = service.PasswordHasherSaturated
+
+    def reject(*args):
+        raise saturated()
+    monkeypatch.setattr(service.password_hasher, "verify_and_update", reject)
+
+    response = client.post("/token", json={"email": "new@example.com", "password": "a_secure_password123"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_hasher_rejects_work_beyond_max_pending(service):
+    hasher = service.password_hasher.__class__(service.password_hasher.context, workers=1, max_pending=0)
+
+    with pytest.raises(service.PasswordHasherSaturated):
+        hasher.hash("password")
+    assert hasher.stats()["rejected"] == 1
@@ -1,11 +1,10 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from shared.app.db_pool import create_instrumented_engine
 from shared.app.settings import Settings
 from . import models
 
 settings = Settings()
-# Add pool_pre_ping to handle connection drops
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+engine = create_instrumented_engine("user_service", settings.DATABASE_URL, settings)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
@@ -1,35 +1,75 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from jose import jwt
-from passlib.context import CryptContext
 
 from . import crud, database, models
-from shared.app import schemas, settings
+from .security import PasswordHasherSaturated, password_hasher
+from shared.app import db_pool, schemas, settings
+from shared.app.log import setup_logging
+from shared.app.metrics import REGISTRY, MetricsMiddleware, metrics_response, stats_collector
+from shared.app.tracing import TracingMiddleware, setup as setup_tracing
 
 app = FastAPI(title="User Service")
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 settings_obj = settings.Settings()
+setup_logging("user_service", settings_obj)
+setup_tracing("user_service", settings_obj)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
+
+REGISTRY.register_collector("password_hasher", stats_collector("user_password_hasher", password_hasher.stats, counters={"rejected"}))
+
+@app.exception_handler(PasswordHasherSaturated)
+async def password_hasher_saturated(request: Request, exc: PasswordHasherSaturated):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Authentication is temporarily overloaded, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("shutdown")
+def shutdown_event():
+    password_hasher.shutdown()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/metrics/password-hasher")
+def password_hasher_metrics():
+    return password_hasher.stats()
+
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    return db_pool.pool_stats()
 
 @app.post("/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
 def register_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
     db_user = crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    hashed_password = password_hasher.hash(user.password)
+    return crud.create_user(db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/token", response_model=schemas.Token)
 def login_for_access_token(user_credentials: schemas.UserCreate, db: Session = Depends(database.get_db)):
     user = crud.get_user_by_email(db, email=user_credentials.email)
-    if not user or not pwd_context.verify(user_credentials.password, user.hashed_password):
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = password_hasher.verify_and_update(user_credentials.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # The stored hash predates the current CryptContext parameters
+        crud.update_password_hash(db, user_id=user.id, hashed_password=new_hash)
     
     to_encode = {"sub": str(user.id), "exp": datetime.utcnow() + timedelta(minutes=30)}
     encoded_jwt = jwt.encode(to_encode, settings_obj.JWT_SECRET_KEY, algorithm="HS256")
-    return {"access_token": encoded_jwt, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": encoded_jwt, "token_type": "bearer"}
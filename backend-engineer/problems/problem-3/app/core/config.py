@@ -11,6 +11,39 @@ class Settings(BaseSettings):
     REDIS_PORT: int
     REDIS_PASSWORD: str
 
+    # Shared Redis connection pool (see core/redis_pool.py). Past max connections,
+    # commands wait up to REDIS_POOL_TIMEOUT seconds for one to be returned
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 2.0
+    # Idle connections are PINGed before reuse after this many seconds
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+
+    # Connection pool for each engine (see core/db_pool.py)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Server-side limit per statement in milliseconds; 0 disables it
+    DB_STATEMENT_TIMEOUT_MS: int = 30000
+
+    # /report/fast cache (see report_cache.py): seconds an entry is fresh, then
+    # how long it may still be served stale while it is refreshed
+    REPORT_CACHE_TTL: int = 300
+    REPORT_CACHE_STALE_TTL: int = 600
+    # Fraction the fresh lifetime is randomly stretched or shrunk by
+    REPORT_CACHE_TTL_JITTER: float = 0.1
+    # How eagerly entries are refreshed before they expire; 0 disables it
+    REPORT_CACHE_EARLY_REFRESH_BETA: float = 1.0
+    # How long one worker may hold the refresh lock; longer than the slowest query
+    REPORT_CACHE_LOCK_TTL: float = 35.0
+    # Encoded responses each worker keeps in front of Redis, dropped on invalidation
+    # and after REPORT_LOCAL_CACHE_TTL seconds at most; a TTL of 0 disables it
+    REPORT_LOCAL_CACHE_SIZE: int = 1024
+    REPORT_LOCAL_CACHE_TTL: float = 5.0
+
     class Config:
         env_file = ".env"
 
@@ -1,16 +1,16 @@
 
-import redis.asyncio as aioredis
-from sqlalchemy import create_engine
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from . import redis_pool
+from .db_pool import create_instrumented_engine
 
 # --- Synchronous Engine (for seeder script) ---
 SYNC_DATABASE_URL = (
     f"postgresql://{settings.DB_USER}:{settings.DB_PASSWORD}@"
     f"{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 )
-sync_engine = create_engine(SYNC_DATABASE_URL)
+sync_engine = create_instrumented_engine("sync", SYNC_DATABASE_URL, settings)
 SyncSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
 
 # --- Asynchronous Engine (for FastAPI app) ---
@@ -18,17 +18,19 @@ ASYNC_DATABASE_URL = (
     f"postgresql+asyncpg://{settings.DB_USER}:{settings.DB_PASSWORD}@"
     f"{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 )
-async_engine = create_async_engine(ASYNC_DATABASE_URL)
+async_engine = create_instrumented_engine("async", ASYNC_DATABASE_URL, settings, is_async=True)
 AsyncSessionLocal = sessionmaker(
     bind=async_engine, class_=AsyncSession, expire_on_commit=False
 )
+REDIS_URL = f"redis://:{settings.REDIS_PASSWORD}@{settings.REDIS_HOST}:{settings.REDIS_PORT}/0"
+
 async def get_redis_client():
-    client = aioredis.from_url(
-        f"redis://:{settings.REDIS_PASSWORD}@{settings.REDIS_HOST}:{settings.REDIS_PORT}/0",
-        decode_responses=True
-    )
-    yield client
-    await client.close()
+    # A client on the shared pool the application lifespan opened; nothing to close per request
+    return redis_pool.get_client()
+
+def get_async_session_factory():
+    # For work that may outlive the request, such as a shared cache refresh
+    return AsyncSessionLocal
 
 async def get_async_db():
     async with AsyncSessionLocal() as session:
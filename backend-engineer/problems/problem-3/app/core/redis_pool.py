@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import redis.asyncio as aioredis
+from redis.exceptions import ConnectionError
+
+from .metrics import REGISTRY
+
+REDIS_POOL_CHECKOUT_SECONDS = REGISTRY.histogram(
+    "redis_pool_checkout_duration_seconds", "Time to get a Redis connection from the pool"
+)
+REDIS_POOL_TIMEOUTS = REGISTRY.counter(
+    "redis_pool_checkout_timeouts_total", "Redis commands that gave up waiting for a free connection"
+)
+
+
+class InstrumentedBlockingConnectionPool(aioredis.BlockingConnectionPool):
+    """
+    A pool that makes callers wait, up to `timeout` seconds, once `max_connections`
+    are in use, instead of opening more. Times every checkout (waiting, connecting,
+    health check) and counts the ones that timed out.
+    """
+
+    async def get_connection(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except ConnectionError as error:
+            # The pool reports running out of time as a ConnectionError caused by a TimeoutError
+            if isinstance(error.__cause__, asyncio.TimeoutError):
+                REDIS_POOL_TIMEOUTS.inc()
+            raise
+        REDIS_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+        return connection
+
+    def stats(self):
+        return {
+            "max_connections": self.max_connections,
+            "in_use": len(self._in_use_connections),
+            "idle": len(self._available_connections),
+        }
+
+
+_client = None
+
+
+def pool_options(settings):
+    """BlockingConnectionPool keyword arguments for the REDIS_* pool settings."""
+    return {
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "timeout": settings.REDIS_POOL_TIMEOUT,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+        "decode_responses": True,
+    }
+
+
+def open_pool(url, settings):
+    """Creates the process-wide client and its pool; called once from the application lifespan."""
+    global _client
+    pool = InstrumentedBlockingConnectionPool.from_url(url, **pool_options(settings))
+    _client = aioredis.Redis(connection_pool=pool)
+    return _client
+
+
+async def close_pool():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.connection_pool.disconnect()
+
+
+def get_client():
+    if _client is None:
+        raise RuntimeError("The Redis pool is not open; it is opened by the application lifespan")
+    return _client
+
+
+def pool_stats():
+    """Live state and checkout counters of the shared pool, or {} while it is closed."""
+    if _client is None:
+        return {}
+    buckets, seconds = REDIS_POOL_CHECKOUT_SECONDS.labels().snapshot()
+    return {
+        **_client.connection_pool.stats(),
+        "checkouts": buckets[-1],
+        "checkout_seconds_total": seconds,
+        "timeouts": REDIS_POOL_TIMEOUTS.labels().value(),
+    }
+
+
+def collect_pool_state():
+    # Live pool state for /metrics; the checkout counters are regular metrics above
+    stats = pool_stats()
+    for key, help in (
+        ("max_connections", "Configured REDIS_MAX_CONNECTIONS"),
+        ("in_use", "Redis connections currently checked out"),
+        ("idle", "Open Redis connections waiting in the pool"),
+    ):
+        if key in stats:
+            yield f"redis_pool_{key}", "gauge", help, [({}, stats[key])]
+
+
+REGISTRY.register_collector("redis_pool", collect_pool_state)
@@ -1,31 +1,111 @@
-from sqlalchemy import func, select
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from sqlalchemy import delete, func, insert, select, text
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from . import models
 
+def _sale_date_window(start: Optional[date], end: Optional[date]):
+    # Whole days, both ends inclusive; half-open on the timestamp so the index range is exact
+    conditions = []
+    if start is not None:
+        conditions.append(models.Sale.sale_date >= datetime.combine(start, time.min))
+    if end is not None:
+        conditions.append(models.Sale.sale_date < datetime.combine(end + timedelta(days=1), time.min))
+    return conditions
+
 # --- SLOW SYNCHRONOUS VERSION ---
 # This simulates the original, unoptimized query.
-def get_sales_report_slow_sync(db: Session, category: str):
+def get_sales_report_slow_sync(db: Session, category: str, start: Optional[date] = None, end: Optional[date] = None):
     return db.query(
         models.Product.name,
         func.sum(models.Sale.quantity).label("total_quantity")
     ).join(models.Sale).where(
-        models.Product.category == category
+        models.Product.category == category,
+        *_sale_date_window(start, end)
     ).group_by(models.Product.name).order_by(
         func.sum(models.Sale.quantity).desc()
     ).all()
 
 # --- FAST ASYNCHRONOUS VERSION ---
-# This query is identical but will be fast due to the index on `category`
-# and runs asynchronously to not block the server.
-async def get_sales_report_fast_async(db: AsyncSession, category: str):
-    query = select(
-        models.Product.name,
-        func.sum(models.Sale.quantity).label("total_quantity")
-    ).join(models.Sale).where(
-        models.Product.category == category
-    ).group_by(models.Product.name).order_by(
-        func.sum(models.Sale.quantity).desc()
-    )
+# Reads the trigger-maintained rollups instead of aggregating sales. Rows are
+# summed per product name, like the slow report, so products sharing a name come
+# back as one row from both endpoints. Without a date window it reads one row per
+# product of the category from product_sales_totals, so the cost depends on the
+# size of the category, not on how many sales exist. With one it sums
+# product_sales_daily buckets: at most one row per product and day in the window.
+async def get_sales_report_fast_async(
+    db: AsyncSession,
+    category: str,
+    limit: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+):
+    if start is None and end is None:
+        total_quantity = func.sum(models.ProductSalesTotal.total_quantity)
+        query = select(
+            models.ProductSalesTotal.name,
+            total_quantity.label("total_quantity")
+        ).where(
+            models.ProductSalesTotal.category == category
+        ).group_by(models.ProductSalesTotal.name).order_by(
+            total_quantity.desc(), models.ProductSalesTotal.name
+        ).limit(limit)
+    else:
+        daily = models.ProductSalesDaily
+        window = [daily.category == category]
+        if start is not None:
+            window.append(daily.sale_day >= start)
+        if end is not None:
+            window.append(daily.sale_day <= end)
+        totals = select(
+            daily.product_id,
+            func.sum(daily.total_quantity).label("total_quantity")
+        ).where(*window).group_by(daily.product_id).subquery()
+        total_quantity = func.sum(totals.c.total_quantity)
+        query = select(
+            models.Product.name,
+            total_quantity.label("total_quantity")
+        ).join(totals, models.Product.id == totals.c.product_id).group_by(models.Product.name).order_by(
+            total_quantity.desc(), models.Product.name
+        ).limit(limit)
     result = await db.execute(query)
-    return result.all()
\ No newline at end of file
+    return result.all()
+
+# --- ROLLUP BACKFILL ---
+# Recomputes product_sales_totals and product_sales_daily from sales in one
+# transaction, for backfills and repairs. Concurrent sale writes wait for it;
+# reports keep reading the old rollups until it commits.
+def rebuild_sales_rollups(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE sales IN SHARE MODE"))
+    db.execute(delete(models.ProductSalesTotal))
+    db.execute(delete(models.ProductSalesDaily))
+    db.execute(insert(models.ProductSalesTotal).from_select(
+        ["product_id", "category", "name", "total_quantity", "sale_count"],
+        select(
+            models.Product.id,
+            models.Product.category,
+            models.Product.name,
+            func.coalesce(func.sum(models.Sale.quantity), 0),
+            func.count(models.Sale.id)
+        ).join(models.Sale).group_by(models.Product.id, models.Product.category, models.Product.name)
+    ))
+    sale_day = func.date(models.Sale.sale_date)
+    db.execute(insert(models.ProductSalesDaily).from_select(
+        ["product_id", "sale_day", "category", "total_quantity", "sale_count"],
+        select(
+            models.Product.id,
+            sale_day,
+            models.Product.category,
+            func.coalesce(func.sum(models.Sale.quantity), 0),
+            func.count(models.Sale.id)
+        ).join(models.Sale).where(
+            models.Sale.sale_date.is_not(None)
+        ).group_by(models.Product.id, sale_day, models.Product.category)
+    ))
+    db.commit()
+    return {
+        "product_sales_totals": db.scalar(select(func.count()).select_from(models.ProductSalesTotal)),
+        "product_sales_daily": db.scalar(select(func.count()).select_from(models.ProductSalesDaily)),
+    }
@@ -1,34 +1,118 @@
 
+import asyncio
 import json
-from fastapi import FastAPI, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager, suppress
+from datetime import date
+from typing import Optional, Tuple
+from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi.responses import Response
+from sqlalchemy.orm import Session, sessionmaker
 import redis.asyncio as aioredis
 from . import crud, schemas
-from .core.db import get_async_db, get_sync_db, get_redis_client
+from .core import db_pool, redis_pool
+from .core.config import settings
+from .core.metrics import REGISTRY, MetricsMiddleware, metrics_response, stats_collector
+from .core.db import REDIS_URL, get_async_session_factory, get_sync_db, get_redis_client
+from .report_cache import REPORT_CACHE, LocalResponseCache, ReportCache
 
-app = FastAPI(title="Performance Optimization Demo")
+report_cache = ReportCache(
+    fresh_ttl=settings.REPORT_CACHE_TTL,
+    stale_ttl=settings.REPORT_CACHE_STALE_TTL,
+    lock_ttl=settings.REPORT_CACHE_LOCK_TTL,
+    jitter=settings.REPORT_CACHE_TTL_JITTER,
+    early_refresh_beta=settings.REPORT_CACHE_EARLY_REFRESH_BETA,
+    local=LocalResponseCache(max_entries=settings.REPORT_LOCAL_CACHE_SIZE, ttl=settings.REPORT_LOCAL_CACHE_TTL),
+)
+REGISTRY.register_collector("report_local_cache", stats_collector(
+    "report_local_cache", report_cache.local.stats, counters=("hits", "misses", "invalidations")
+))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    redis_pool.open_pool(REDIS_URL, settings)
+    # The local report cache serves only while this subscription is up. It blocks on
+    # one connection for good, so it gets its own client without the pool's read timeout
+    subscriber = aioredis.from_url(REDIS_URL, decode_responses=True)
+    invalidations = asyncio.create_task(report_cache.local.listen(subscriber))
+    yield
+    invalidations.cancel()
+    with suppress(asyncio.CancelledError):
+        await invalidations
+    # Let background cache refreshes finish writing before the process exits
+    await report_cache.drain()
+    await subscriber.aclose()
+    await redis_pool.close_pool()
+
+app = FastAPI(title="Performance Optimization Demo", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+@app.get("/metrics/db-pool")
+def db_pool_metrics():
+    return db_pool.pool_stats()
+
+@app.get("/metrics/redis-pool")
+def redis_pool_metrics():
+    return redis_pool.pool_stats()
+
+def encode_cached_report(category: str, report: list) -> bytes:
+    # Cached reports were validated when they were computed; encode them the way
+    # JSONResponse would, without building the response model again
+    return json.dumps(
+        {"source": "cache", "category": category, "report": report},
+        ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+def report_window(
+    start: Optional[date] = Query(None, description="First sale day to include"),
+    end: Optional[date] = Query(None, description="Last sale day to include"),
+) -> Tuple[Optional[date], Optional[date]]:
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=422, detail="start must not be after end")
+    return start, end
 
 @app.get("/report/slow", response_model=schemas.ReportResponse)
-def read_slow_report(category: str = "electronics", db: Session = Depends(get_sync_db)):
-    report_data = crud.get_sales_report_slow_sync(db, category)
+def read_slow_report(
+    category: str = "electronics",
+    window: Tuple[Optional[date], Optional[date]] = Depends(report_window),
+    db: Session = Depends(get_sync_db)
+):
+    report_data = crud.get_sales_report_slow_sync(db, category, *window)
     return {"source": "database", "category": category, "report": report_data}
 
 @app.get("/report/fast", response_model=schemas.ReportResponse)
 async def read_fast_report(
     category: str = "electronics",
-    db: AsyncSession = Depends(get_async_db),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Return only the top sellers"),
+    window: Tuple[Optional[date], Optional[date]] = Depends(report_window),
+    session_factory: sessionmaker = Depends(get_async_session_factory),
     redis: aioredis.Redis = Depends(get_redis_client)
 ):
+    start, end = window
     cache_key = f"report:{category}"
-    cached_report = await redis.get(cache_key)
-    if cached_report:
-        report_list = json.loads(cached_report)
-        return {"source": "cache", "category": category, "report": report_list}
-
-    report_data = await crud.get_sales_report_fast_async(db, category)
-    report_list_for_cache = [
-        {"name": row.name, "total_quantity": row.total_quantity} for row in report_data
-    ]
-    await redis.setex(cache_key, 300, json.dumps(report_list_for_cache))
-    return {"source": "database", "category": category, "report": report_data}
\ No newline at end of file
+    if start is not None or end is not None:
+        cache_key += f":{start or ''}..{end or ''}"
+    if limit is not None:
+        cache_key += f":top{limit}"
+
+    local_version = report_cache.local.version
+    body = report_cache.local.get(cache_key)
+    if body is not None:
+        REPORT_CACHE.labels("local_hit").inc()
+        return Response(body, media_type="application/json")
+
+    async def compute():
+        # Opens its own session: the refresh is shared and may outlive this request
+        async with session_factory() as db:
+            report_data = await crud.get_sales_report_fast_async(db, category, limit, start, end)
+        return [{"name": row.name, "total_quantity": row.total_quantity} for row in report_data]
+
+    report, source = await report_cache.get(redis, cache_key, compute)
+    if source == "database":
+        return {"source": source, "category": category, "report": report}
+    body = encode_cached_report(category, report)
+    report_cache.local.put(cache_key, body, local_version)
+    return Response(body, media_type="application/json")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import DDL, Column, Date, Integer, String, ForeignKey, DateTime, Index, event
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
@@ -15,4 +15,187 @@ class Sale(Base):
     product_id = Column(Integer, ForeignKey("products.id"))
     quantity = Column(Integer)
     sale_date = Column(DateTime)
-    product = relationship("Product")
\ No newline at end of file
+    product = relationship("Product")
+
+    __table_args__ = (
+        # Per-product history for a date range
+        Index("ix_sales_product_id_sale_date", "product_id", "sale_date"),
+        # Sales arrive in sale_date order, so a BRIN index prunes a date range to a
+        # few block ranges at a tiny fraction of a B-tree's size (plain index on SQLite)
+        Index("ix_sales_sale_date", "sale_date", postgresql_using="brin"),
+    )
+
+class ProductSalesTotal(Base):
+    """
+    Per-product rollup of `sales`, maintained by database triggers on every insert,
+    update and delete (see the DDL below), so reports never aggregate the sales
+    table. name and category are copied from products, so a category's report is
+    read from this table alone. Rebuild with `python -m scripts.rebuild_sales_rollups`.
+    """
+    __tablename__ = "product_sales_totals"
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    category = Column(String)
+    name = Column(String)
+    total_quantity = Column(Integer, nullable=False, default=0)
+    # Number of sales rows behind the total; the row is removed when it drops to zero
+    sale_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_product_sales_totals_category_total", "category", total_quantity.desc(), "product_id"),
+    )
+
+
+class ProductSalesDaily(Base):
+    """
+    Per-product, per-day buckets of `sales`, maintained by the same triggers. A
+    date-range report sums at most one row per product and day instead of every
+    sale. Sales without a sale_date are not bucketed.
+    """
+    __tablename__ = "product_sales_daily"
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    sale_day = Column(Date, primary_key=True)
+    category = Column(String)
+    total_quantity = Column(Integer, nullable=False, default=0)
+    sale_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_product_sales_daily_category_day", "category", "sale_day"),
+    )
+
+
+# --- Rollup maintenance ---
+# PostgreSQL: statement-level triggers with transition tables apply one aggregated
+# delta per statement, so a bulk insert costs one upsert per product (and day), not
+# per row. Rows are upserted in key order so concurrent statements lock them in the
+# same order. Products whose last sale went away drop out, as they do from the join.
+
+_PG_CHANGES = {
+    "insert": "SELECT product_id, sale_date, quantity, 1 AS n FROM new_sales",
+    "delete": "SELECT product_id, sale_date, -quantity AS quantity, -1 AS n FROM old_sales",
+    "update": "SELECT product_id, sale_date, quantity, 1 AS n FROM new_sales "
+              "UNION ALL SELECT product_id, sale_date, -quantity, -1 FROM old_sales",
+}
+_PG_TRANSITION_TABLES = {
+    "insert": "REFERENCING NEW TABLE AS new_sales",
+    "delete": "REFERENCING OLD TABLE AS old_sales",
+    "update": "REFERENCING NEW TABLE AS new_sales OLD TABLE AS old_sales",
+}
+_PG_APPLY_TOTALS = """
+    WITH changes AS ({changes})
+    INSERT INTO product_sales_totals (product_id, category, name, total_quantity, sale_count)
+    SELECT p.id, p.category, p.name, d.total_quantity, d.sale_count
+    FROM (
+        SELECT product_id, COALESCE(SUM(quantity), 0) AS total_quantity, SUM(n) AS sale_count
+        FROM changes GROUP BY product_id
+    ) AS d
+    JOIN products p ON p.id = d.product_id
+    ORDER BY p.id
+    ON CONFLICT (product_id) DO UPDATE SET
+        total_quantity = product_sales_totals.total_quantity + EXCLUDED.total_quantity,
+        sale_count = product_sales_totals.sale_count + EXCLUDED.sale_count;
+"""
+_PG_APPLY_DAILY = """
+    WITH changes AS ({changes})
+    INSERT INTO product_sales_daily (product_id, sale_day, category, total_quantity, sale_count)
+    SELECT p.id, d.sale_day, p.category, d.total_quantity, d.sale_count
+    FROM (
+        SELECT product_id, CAST(sale_date AS date) AS sale_day,
+               COALESCE(SUM(quantity), 0) AS total_quantity, SUM(n) AS sale_count
+        FROM changes WHERE sale_date IS NOT NULL GROUP BY product_id, CAST(sale_date AS date)
+    ) AS d
+    JOIN products p ON p.id = d.product_id
+    ORDER BY p.id, d.sale_day
+    ON CONFLICT (product_id, sale_day) DO UPDATE SET
+        total_quantity = product_sales_daily.total_quantity + EXCLUDED.total_quantity,
+        sale_count = product_sales_daily.sale_count + EXCLUDED.sale_count;
+"""
+_PG_REMOVE_EMPTY = """
+    DELETE FROM product_sales_totals
+    WHERE sale_count <= 0 AND product_id IN (SELECT product_id FROM old_sales);
+    DELETE FROM product_sales_daily
+    WHERE sale_count <= 0 AND product_id IN (SELECT product_id FROM old_sales);
+"""
+
+_PG_DDL = []
+for _op, _changes in _PG_CHANGES.items():
+    _PG_DDL += [
+        f"""
+        CREATE OR REPLACE FUNCTION product_sales_totals_on_{_op}() RETURNS trigger AS $$
+        BEGIN
+            {_PG_APPLY_TOTALS.format(changes=_changes)}
+            {_PG_APPLY_DAILY.format(changes=_changes)}
+            {_PG_REMOVE_EMPTY if _op != "insert" else ""}
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS product_sales_totals_on_{_op} ON sales",
+        f"""
+        CREATE TRIGGER product_sales_totals_on_{_op} AFTER {_op.upper()} ON sales
+        {_PG_TRANSITION_TABLES[_op]}
+        FOR EACH STATEMENT EXECUTE FUNCTION product_sales_totals_on_{_op}()
+        """,
+    ]
+_PG_DDL += [
+    """
+    CREATE OR REPLACE FUNCTION product_sales_totals_on_product_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE product_sales_totals SET name = NEW.name, category = NEW.category WHERE product_id = NEW.id;
+        IF NEW.category IS DISTINCT FROM OLD.category THEN
+            UPDATE product_sales_daily SET category = NEW.category WHERE product_id = NEW.id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS product_sales_totals_on_product_update ON products",
+    """
+    CREATE TRIGGER product_sales_totals_on_product_update AFTER UPDATE OF name, category ON products
+    FOR EACH ROW EXECUTE FUNCTION product_sales_totals_on_product_update()
+    """,
+]
+
+# SQLite (tests) has no statement-level triggers: the same deltas, one row at a time.
+_SQLITE_ADD = """
+    INSERT INTO product_sales_totals (product_id, category, name, total_quantity, sale_count)
+    SELECT id, category, name, COALESCE(NEW.quantity, 0), 1 FROM products WHERE id = NEW.product_id
+    ON CONFLICT (product_id) DO UPDATE SET
+        total_quantity = total_quantity + excluded.total_quantity,
+        sale_count = sale_count + 1;
+    INSERT INTO product_sales_daily (product_id, sale_day, category, total_quantity, sale_count)
+    SELECT id, date(NEW.sale_date), category, COALESCE(NEW.quantity, 0), 1 FROM products
+    WHERE id = NEW.product_id AND NEW.sale_date IS NOT NULL
+    ON CONFLICT (product_id, sale_day) DO UPDATE SET
+        total_quantity = total_quantity + excluded.total_quantity,
+        sale_count = sale_count + 1;
+"""
+_SQLITE_REMOVE = """
+    UPDATE product_sales_totals
+    SET total_quantity = total_quantity - COALESCE(OLD.quantity, 0), sale_count = sale_count - 1
+    WHERE product_id = OLD.product_id;
+    DELETE FROM product_sales_totals WHERE product_id = OLD.product_id AND sale_count <= 0;
+    UPDATE product_sales_daily
+    SET total_quantity = total_quantity - COALESCE(OLD.quantity, 0), sale_count = sale_count - 1
+    WHERE product_id = OLD.product_id AND sale_day = date(OLD.sale_date);
+    DELETE FROM product_sales_daily
+    WHERE product_id = OLD.product_id AND sale_day = date(OLD.sale_date) AND sale_count <= 0;
+"""
+_SQLITE_DDL = [
+    f"CREATE TRIGGER IF NOT EXISTS product_sales_totals_on_insert AFTER INSERT ON sales BEGIN {_SQLITE_ADD} END",
+    f"CREATE TRIGGER IF NOT EXISTS product_sales_totals_on_delete AFTER DELETE ON sales BEGIN {_SQLITE_REMOVE} END",
+    f"CREATE TRIGGER IF NOT EXISTS product_sales_totals_on_update AFTER UPDATE ON sales BEGIN {_SQLITE_REMOVE} {_SQLITE_ADD} END",
+    """
+    CREATE TRIGGER IF NOT EXISTS product_sales_totals_on_product_update AFTER UPDATE OF name, category ON products
+    BEGIN
+        UPDATE product_sales_totals SET name = NEW.name, category = NEW.category WHERE product_id = NEW.id;
+        UPDATE product_sales_daily SET category = NEW.category
+        WHERE product_id = NEW.id AND NEW.category IS NOT OLD.category;
+    END
+    """,
+]
+
+# Installed whenever the schema is created, once every table exists
+for _statement in _PG_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+for _statement in _SQLITE_DDL:
+    event.listen(Base.metadata, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
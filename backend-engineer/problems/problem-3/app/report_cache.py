@@ -0,0 +1,278 @@
+"""
+Report caching that holds up when a popular key expires.
+
+Each Redis entry is an envelope: the report, when it stops being fresh and how
+long the query behind it took. An entry is served as is while fresh. Within
+the stale window that follows it is still served, but the first request to
+see it starts a background refresh. Only a request that finds nothing cached
+at all waits for the database.
+
+Refreshes are single-flight. Within a process, concurrent callers share one
+task. Across processes, a short Redis lock decides which one runs the query;
+the others keep serving the stale entry or, on a cold miss, wait for the
+lock holder's result. Fresh lifetimes are jittered, and entries are refreshed
+early with a probability that grows as expiry nears and with how slow the
+query is ("XFetch"). Keys written together therefore don't expire together.
+
+In front of Redis, each process keeps the encoded responses it served most
+recently (LocalResponseCache). Whenever an entry is rewritten in Redis, its key
+is published on INVALIDATION_CHANNEL, and every process drops its copy.
+"""
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Tuple
+
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+
+from .core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE = REGISTRY.counter("report_cache_requests_total", "Fast report lookups by cache outcome", ["result"])
+REPORT_CACHE_REFRESHES = REGISTRY.counter(
+    "report_cache_refreshes_total", "Report queries run to fill the cache, by trigger", ["trigger"]
+)
+
+Report = List[dict]
+
+INVALIDATION_CHANNEL = "report-cache:invalidate"
+# Published on INVALIDATION_CHANNEL to drop every local entry
+INVALIDATE_ALL = "*"
+
+
+class CacheEntry(NamedTuple):
+    report: Report
+    fresh_until: float
+    compute_seconds: float
+
+
+def _decode(raw) -> Optional[CacheEntry]:
+    if raw is None:
+        return None
+    value = json.loads(raw)
+    if isinstance(value, list):
+        # Written before entries had an envelope: serve it, but as stale
+        return CacheEntry(value, 0.0, 0.0)
+    return CacheEntry(value["report"], value["fresh_until"], value["compute_seconds"])
+
+
+class LocalResponseCache:
+    """
+    Encoded responses held in this process: an LRU of `key -> (expires_at, body)`
+    bounded at `max_entries`, each kept at most `ttl` seconds. It only serves while
+    `listen()` is subscribed to invalidations. A process cut off from Redis therefore
+    can't keep returning entries that the other processes have dropped. Everything
+    runs on the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.active = False
+        # Bumped by every invalidation; see put()
+        self.version = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key) -> Optional[bytes]:
+        if not self.active:
+            return None
+        item = self._entries.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key, body: bytes, version):
+        """
+        Stores `body`, read from Redis when the cache was at `version`. It is discarded if an
+        invalidation has arrived since, because the body may predate it.
+        """
+        if not self.active or self.ttl <= 0 or version != self.version:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self.version += 1
+        self.invalidations += 1
+        if key == INVALIDATE_ALL:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    async def listen(self, redis: aioredis.Redis, channel=INVALIDATION_CHANNEL):
+        """Applies invalidations published on `channel` until cancelled, resubscribing after errors."""
+        delay = 0.5
+        while True:
+            pubsub = redis.pubsub()
+            try:
+                await pubsub.subscribe(channel)
+                self.active = True
+                delay = 0.5
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        data = message["data"]
+                        self.invalidate(data.decode() if isinstance(data, bytes) else data)
+            except Exception:
+                logger.warning("Report cache invalidation channel lost; serving from Redis until it is back", exc_info=True)
+            finally:
+                # Invalidations may be missed from here on, so nothing cached so far can be trusted
+                self.active = False
+                self._entries.clear()
+                self.version += 1
+                await pubsub.aclose()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+class ReportCache:
+    """Stale-while-revalidate cache of report lists in Redis, one instance per process."""
+
+    def __init__(
+        self, fresh_ttl, stale_ttl, lock_ttl, jitter=0.1, early_refresh_beta=1.0, poll_interval=0.05, local=None
+    ):
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.lock_ttl = lock_ttl
+        self.jitter = jitter
+        self.early_refresh_beta = early_refresh_beta
+        self.poll_interval = poll_interval
+        # Encoded responses in front of Redis; the endpoint reads and fills it
+        self.local = local if local is not None else LocalResponseCache(max_entries=0, ttl=0)
+        # key -> the task currently computing it in this process. Background refreshes
+        # and cold-miss loads are kept apart: a refresh gives up (returns None) when
+        # another process holds the lock, so only a load is something a miss can wait on.
+        self._refreshing = {}
+        self._loading = {}
+
+    async def get(
+        self, redis: aioredis.Redis, key: str, compute: Callable[[], Awaitable[Report]]
+    ) -> Tuple[Report, str]:
+        """
+        The report for `key` and where it came from, "cache" or "database".
+        `compute` runs the query; it must not depend on the calling request,
+        because a refresh it starts may outlive that request.
+        """
+        entry = _decode(await redis.get(key))
+        if entry is not None:
+            now = time.time()
+            if now >= entry.fresh_until:
+                REPORT_CACHE.labels("stale").inc()
+                self._refresh_in_background(redis, key, compute, "stale")
+            else:
+                REPORT_CACHE.labels("hit").inc()
+                if self._refresh_early(entry, now):
+                    self._refresh_in_background(redis, key, compute, "early")
+            return entry.report, "cache"
+
+        task = self._loading.get(key)
+        if task is not None:
+            REPORT_CACHE.labels("coalesced").inc()
+        else:
+            REPORT_CACHE.labels("miss").inc()
+            task = self._start(self._loading, key, self._load(redis, key, compute))
+        # Shielded, so a client that disconnects doesn't cancel the query for everyone else
+        return await asyncio.shield(task), "database"
+
+    def _refresh_early(self, entry, now):
+        # XFetch: -log(u) is exponentially distributed, so the chance of going early
+        # rises smoothly towards expiry and faster for slower queries
+        return now - entry.compute_seconds * self.early_refresh_beta * math.log(1.0 - random.random()) >= entry.fresh_until
+
+    def _start(self, tasks, key, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        tasks[key] = task
+        task.add_done_callback(lambda done: self._finished(tasks, key, done))
+        return task
+
+    def _finished(self, tasks, key, task):
+        if tasks.get(key) is task:
+            del tasks[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Report cache refresh for %s failed", key, exc_info=task.exception())
+
+    def _refresh_in_background(self, redis, key, compute, trigger):
+        if key not in self._refreshing:
+            self._start(self._refreshing, key, self._refresh(redis, key, compute, trigger))
+
+    async def _refresh(self, redis, key, compute, trigger) -> Optional[Report]:
+        """Recomputes and stores `key` if this process wins the lock; None if another holds it."""
+        lock_key = f"lock:{key}"
+        token = uuid.uuid4().hex
+        if not await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+            return None
+        try:
+            return await self._compute_and_store(redis, key, compute, trigger)
+        finally:
+            await self._release(redis, lock_key, token)
+
+    async def _load(self, redis, key, compute) -> Report:
+        report = await self._refresh(redis, key, compute, "miss")
+        if report is not None:
+            return report
+        # Another process is running this query: wait for its result instead of repeating it
+        deadline = time.monotonic() + self.lock_ttl
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            entry = _decode(await redis.get(key))
+            if entry is not None:
+                return entry.report
+            if not await redis.exists(f"lock:{key}"):
+                break
+        # The lock holder gave up or died without storing anything
+        return await self._compute_and_store(redis, key, compute, "miss")
+
+    async def _compute_and_store(self, redis, key, compute, trigger) -> Report:
+        REPORT_CACHE_REFRESHES.labels(trigger).inc()
+        started = time.perf_counter()
+        report = await compute()
+        compute_seconds = time.perf_counter() - started
+        fresh_for = self.fresh_ttl * random.uniform(1 - self.jitter, 1 + self.jitter)
+        envelope = {"report": report, "fresh_until": time.time() + fresh_for, "compute_seconds": compute_seconds}
+        await redis.set(key, json.dumps(envelope), ex=max(1, math.ceil(fresh_for + self.stale_ttl)))
+        self.local.invalidate(key)
+        await redis.publish(INVALIDATION_CHANNEL, key)
+        return report
+
+    async def _release(self, redis, lock_key, token):
+        # Delete the lock only if it is still ours; it may have expired and been taken over
+        try:
+            async with redis.pipeline() as pipe:
+                await pipe.watch(lock_key)
+                if await pipe.get(lock_key) == token:
+                    pipe.multi()
+                    pipe.delete(lock_key)
+                    await pipe.execute()
+        except WatchError:
+            pass
+
+    async def drain(self):
+        """Waits for refreshes in flight, e.g. at shutdown."""
+        while self._refreshing or self._loading:
+            tasks = [*self._refreshing.values(), *self._loading.values()]
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,20 @@
+from app.core.db import sync_engine, SyncSessionLocal
+from app.crud import rebuild_sales_rollups
+from app.models import Base
+
+def rebuild_rollups():
+    # Creates the rollup tables and their triggers if this database predates them
+    print("--- Installing product_sales_totals, product_sales_daily and their triggers... ---")
+    Base.metadata.create_all(sync_engine)
+
+    print("--- Rebuilding the sales rollups from sales... ---")
+    session = SyncSessionLocal()
+    try:
+        counts = rebuild_sales_rollups(session)
+    finally:
+        session.close()
+    for table, rows in counts.items():
+        print(f"✓ {rows} {table} rows rebuilt.")
+
+if __name__ == "__main__":
+    rebuild_rollups()
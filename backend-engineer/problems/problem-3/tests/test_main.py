@@ -1,16 +1,27 @@
 import pytest
+import asyncio
 import json
 import time
 import os
+from contextlib import suppress
+from datetime import date, datetime
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy import create_engine, delete
+from sqlalchemy import create_engine, delete, select, update
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from fakeredis.aioredis import FakeRedis
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeAsyncRedisConnection, FakeRedis
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
 
-from app.main import app
-from app.core.db import get_async_db, get_sync_db, get_redis_client
-from app.models import Base, Product, Sale
+from app.main import app, report_cache
+from app.core.config import settings
+from app.core.metrics import REGISTRY
+from app.core.redis_pool import REDIS_POOL_TIMEOUTS, InstrumentedBlockingConnectionPool
+from app.core.db import get_async_db, get_async_session_factory, get_sync_db, get_redis_client
+from app.crud import rebuild_sales_rollups
+from app.report_cache import INVALIDATION_CHANNEL, REPORT_CACHE, REPORT_CACHE_REFRESHES
+from app.models import Base, Product, ProductSalesDaily, ProductSalesTotal, Sale
 
 # This ensures the database persists between connections in the same test session,
 # avoiding the "no such table" error with ephemeral in-memory databases.
@@ -47,6 +58,7 @@ async def override_get_async_db():
 
 app.dependency_overrides[get_sync_db] = override_get_sync_db
 app.dependency_overrides[get_async_db] = override_get_async_db
+app.dependency_overrides[get_async_session_factory] = lambda: TestAsyncSessionLocal
 app.dependency_overrides[get_redis_client] = override_get_redis_client
 
 # --- Pytest Fixtures ---
@@ -79,9 +91,13 @@ async def manage_data_between_tests():
     yield # Run the test
 
     # Teardown: Clean all data from tables
+    await report_cache.drain()
     await fake_redis_client.flushall()
     with TestSyncSessionLocal() as db:
         db.execute(delete(Sale))
+        # Emptied by the sales triggers already; cleared here too in case a test wrote it directly
+        db.execute(delete(ProductSalesTotal))
+        db.execute(delete(ProductSalesDaily))
         db.execute(delete(Product))
         db.commit()
 
@@ -174,3 +190,284 @@ async def test_performance_difference(async_client: AsyncClient):
     if duration_fast_hit > 0:
         print(f"The cache hit was {duration_slow / duration_fast_hit:.2f}x faster than the sync DB query.")
         print(f"The cache hit was {duration_fast_miss / duration_fast_hit:.2f}x faster than the async DB query.")
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(async_client: AsyncClient):
+    await async_client.get("/report/fast?category=books")
+    await async_client.get("/report/fast?category=books")
+    response = await async_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/report/fast",status="200"}' in body
+    assert 'report_cache_requests_total{result="hit"}' in body
+    assert 'report_cache_requests_total{result="miss"}' in body
+    assert 'db_pool_size{engine="async"}' in body
+
+def sales_totals(db):
+    return {
+        row.product_id: (row.category, row.name, row.total_quantity, row.sale_count)
+        for row in db.scalars(select(ProductSalesTotal))
+    }
+
+def test_sales_totals_follow_sales_writes():
+    with TestSyncSessionLocal() as db:
+        assert sales_totals(db) == {
+            1: ("electronics", "Laptop", 15, 2),
+            2: ("electronics", "Mouse", 20, 1),
+            3: ("books", "Book", 50, 1),
+        }
+        db.add(Sale(product_id=1, quantity=7))
+        db.execute(update(Sale).where(Sale.product_id == 2).values(product_id=1))
+        db.execute(delete(Sale).where(Sale.product_id == 3))
+        db.execute(update(Product).where(Product.id == 1).values(name="Notebook"))
+        db.commit()
+        # Mouse and Book have no sales left, so they drop out like they do from the join
+        assert sales_totals(db) == {1: ("electronics", "Notebook", 42, 4)}
+
+        db.execute(update(ProductSalesTotal).values(total_quantity=0))
+        db.commit()
+        assert rebuild_sales_rollups(db) == {"product_sales_totals": 1, "product_sales_daily": 0}
+        assert sales_totals(db) == {1: ("electronics", "Notebook", 42, 4)}
+
+@pytest.mark.asyncio
+async def test_fast_report_reads_top_sellers_from_rollup(async_client: AsyncClient):
+    with TestSyncSessionLocal() as db:
+        db.add(Sale(product_id=1, quantity=30))
+        db.commit()
+    slow = (await async_client.get("/report/slow?category=electronics")).json()["report"]
+    fast = (await async_client.get("/report/fast?category=electronics")).json()["report"]
+    assert fast == slow == [{"name": "Laptop", "total_quantity": 45}, {"name": "Mouse", "total_quantity": 20}]
+
+    response = await async_client.get("/report/fast?category=electronics&limit=1")
+    assert response.json()["report"] == [{"name": "Laptop", "total_quantity": 45}]
+    assert await fake_redis_client.get("report:electronics:top1") is not None
+    assert (await async_client.get("/report/fast?limit=0")).status_code == 422
+
+@pytest.mark.asyncio
+async def test_fast_report_merges_products_sharing_a_name(async_client: AsyncClient):
+    # /report/slow groups by product name; the rollup path must agree
+    with TestSyncSessionLocal() as db:
+        db.add_all([Product(id=4, name="Mouse", category="electronics"), Sale(product_id=4, quantity=7)])
+        db.commit()
+    slow = (await async_client.get("/report/slow?category=electronics")).json()["report"]
+    fast = (await async_client.get("/report/fast?category=electronics")).json()["report"]
+    assert fast == slow == [{"name": "Mouse", "total_quantity": 27}, {"name": "Laptop", "total_quantity": 15}]
+
+def sales_daily(db):
+    return {
+        (row.product_id, row.sale_day): (row.total_quantity, row.sale_count)
+        for row in db.scalars(select(ProductSalesDaily))
+    }
+
+def test_daily_buckets_follow_sales_writes():
+    with TestSyncSessionLocal() as db:
+        # The fixture's sales have no sale_date, so they are not bucketed
+        assert sales_daily(db) == {}
+        db.add_all([
+            Sale(product_id=1, quantity=3, sale_date=datetime(2024, 3, 1, 9)),
+            Sale(product_id=1, quantity=4, sale_date=datetime(2024, 3, 1, 23, 59)),
+            Sale(product_id=2, quantity=6, sale_date=datetime(2024, 3, 2, 0, 0)),
+        ])
+        db.commit()
+        assert sales_daily(db) == {(1, date(2024, 3, 1)): (7, 2), (2, date(2024, 3, 2)): (6, 1)}
+
+        db.execute(update(Sale).where(Sale.quantity == 6).values(sale_date=datetime(2024, 3, 1, 12)))
+        db.execute(delete(Sale).where(Sale.quantity == 3))
+        db.commit()
+        assert sales_daily(db) == {(1, date(2024, 3, 1)): (4, 1), (2, date(2024, 3, 1)): (6, 1)}
+
+        db.execute(delete(ProductSalesDaily))
+        db.commit()
+        assert rebuild_sales_rollups(db)["product_sales_daily"] == 2
+        assert sales_daily(db) == {(1, date(2024, 3, 1)): (4, 1), (2, date(2024, 3, 1)): (6, 1)}
+
+@pytest.mark.asyncio
+async def test_reports_filter_by_sale_date_window(async_client: AsyncClient):
+    with TestSyncSessionLocal() as db:
+        db.add_all([
+            Sale(product_id=1, quantity=1, sale_date=datetime(2024, 2, 29, 23, 59)),
+            Sale(product_id=1, quantity=2, sale_date=datetime(2024, 3, 1, 0, 0)),
+            Sale(product_id=2, quantity=3, sale_date=datetime(2024, 3, 2, 12)),
+            Sale(product_id=2, quantity=4, sale_date=datetime(2024, 3, 3, 23, 59)),
+            Sale(product_id=1, quantity=8, sale_date=datetime(2024, 3, 4, 0, 0)),
+        ])
+        db.commit()
+    query = "category=electronics&start=2024-03-01&end=2024-03-03"
+    slow = (await async_client.get(f"/report/slow?{query}")).json()["report"]
+    fast = (await async_client.get(f"/report/fast?{query}")).json()["report"]
+    assert fast == slow == [{"name": "Mouse", "total_quantity": 7}, {"name": "Laptop", "total_quantity": 2}]
+    assert await fake_redis_client.get("report:electronics:2024-03-01..2024-03-03") is not None
+
+    # Open-ended windows, and a limit on top
+    response = await async_client.get("/report/fast?category=electronics&start=2024-03-03&limit=1")
+    assert response.json()["report"] == [{"name": "Laptop", "total_quantity": 8}]
+    slow = (await async_client.get("/report/slow?category=electronics&end=2024-02-29")).json()["report"]
+    assert slow == [{"name": "Laptop", "total_quantity": 1}]
+
+    # Products sharing a name are one row, as in the slow report
+    with TestSyncSessionLocal() as db:
+        db.add_all([Product(id=4, name="Laptop", category="electronics"),
+                    Sale(product_id=4, quantity=6, sale_date=datetime(2024, 3, 2, 8))])
+        db.commit()
+    query = "category=electronics&start=2024-03-01&end=2024-03-02"
+    slow = (await async_client.get(f"/report/slow?{query}")).json()["report"]
+    fast = (await async_client.get(f"/report/fast?{query}")).json()["report"]
+    assert fast == slow == [{"name": "Laptop", "total_quantity": 8}, {"name": "Mouse", "total_quantity": 3}]
+
+    assert (await async_client.get("/report/fast?start=2024-03-02&end=2024-03-01")).status_code == 422
+    assert (await async_client.get("/report/slow?start=2024-03-02&end=2024-03-01")).status_code == 422
+
+def refreshes(trigger):
+    return REPORT_CACHE_REFRESHES.labels(trigger).value()
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_query(async_client: AsyncClient):
+    before, coalesced = refreshes("miss"), REPORT_CACHE.labels("coalesced").value()
+    responses = await asyncio.gather(*(async_client.get("/report/fast?category=electronics") for _ in range(20)))
+    assert refreshes("miss") - before == 1
+    assert REPORT_CACHE.labels("coalesced").value() - coalesced == 19
+    assert {response.json()["report"][0]["name"] for response in responses} == {"Mouse"}
+
+@pytest.mark.asyncio
+async def test_stale_report_is_served_while_it_is_refreshed(async_client: AsyncClient):
+    stale = {"report": [{"name": "Mouse", "total_quantity": 1}], "fresh_until": time.time() - 1, "compute_seconds": 0.01}
+    await fake_redis_client.set("report:electronics", json.dumps(stale))
+    before = refreshes("stale")
+
+    response = await async_client.get("/report/fast?category=electronics")
+    assert response.json()["source"] == "cache"
+    assert response.json()["report"] == [{"name": "Mouse", "total_quantity": 1}]
+    await report_cache.drain()
+    assert refreshes("stale") - before == 1
+
+    response = await async_client.get("/report/fast?category=electronics")
+    assert response.json()["report"][0] == {"name": "Mouse", "total_quantity": 20}
+    entry = json.loads(await fake_redis_client.get("report:electronics"))
+    assert entry["fresh_until"] > time.time()
+    assert await fake_redis_client.ttl("report:electronics") > report_cache.stale_ttl
+
+@pytest.mark.asyncio
+async def test_miss_waits_for_the_worker_holding_the_lock(async_client: AsyncClient):
+    # Another process is computing this report; its result should be used, not recomputed
+    await fake_redis_client.set("lock:report:books", "another-worker", px=5000)
+    before = refreshes("miss")
+
+    async def other_worker_finishes():
+        await asyncio.sleep(0.1)
+        entry = {"report": [{"name": "Book", "total_quantity": 50}], "fresh_until": time.time() + 60, "compute_seconds": 0.01}
+        await fake_redis_client.set("report:books", json.dumps(entry))
+
+    response, _ = await asyncio.gather(async_client.get("/report/fast?category=books"), other_worker_finishes())
+    assert response.json()["report"] == [{"name": "Book", "total_quantity": 50}]
+    assert refreshes("miss") == before
+    assert await fake_redis_client.get("lock:report:books") == "another-worker"
+
+class SlowLockRedis:
+    """Delays taking a lock, so a background refresh is still in flight when the next request arrives."""
+
+    def __init__(self, redis):
+        self._redis = redis
+
+    def __getattr__(self, name):
+        return getattr(self._redis, name)
+
+    async def set(self, *args, nx=False, **kwargs):
+        if nx:
+            await asyncio.sleep(0.05)
+        return await self._redis.set(*args, nx=nx, **kwargs)
+
+@pytest.mark.asyncio
+async def test_miss_does_not_wait_on_a_refresh_that_lost_the_lock():
+    redis = SlowLockRedis(fake_redis_client)
+    await fake_redis_client.set("lock:report:books", "another-worker", px=5000)
+    stale = {"report": [{"name": "Book", "total_quantity": 1}], "fresh_until": time.time() - 1, "compute_seconds": 0.01}
+    await fake_redis_client.set("report:books", json.dumps(stale))
+    before = refreshes("miss")
+
+    async def compute():
+        raise AssertionError("the worker holding the lock computes this report")
+
+    # Starts a background refresh, which will find the lock taken and give up
+    assert await report_cache.get(redis, "report:books", compute) == (stale["report"], "cache")
+    # The entry expires while that refresh is in flight
+    await fake_redis_client.delete("report:books")
+
+    async def other_worker_finishes():
+        await asyncio.sleep(0.1)
+        entry = {"report": [{"name": "Book", "total_quantity": 50}], "fresh_until": time.time() + 60, "compute_seconds": 0.01}
+        await fake_redis_client.set("report:books", json.dumps(entry))
+
+    (report, source), _ = await asyncio.gather(report_cache.get(redis, "report:books", compute), other_worker_finishes())
+    assert (report, source) == ([{"name": "Book", "total_quantity": 50}], "database")
+    assert refreshes("miss") == before
+
+async def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_local_cache_serves_encoded_responses_until_invalidated(async_client: AsyncClient):
+    local = report_cache.local
+    listener = asyncio.create_task(local.listen(fake_redis_client))
+    try:
+        await wait_for(lambda: local.active)
+        assert (await async_client.get("/report/fast?category=electronics")).json()["source"] == "database"
+        from_redis = await async_client.get("/report/fast?category=electronics")
+        hits = local.hits
+        from_local = await async_client.get("/report/fast?category=electronics")
+        assert local.hits == hits + 1
+        assert from_local.content == from_redis.content
+        assert from_local.json() == {
+            "source": "cache", "category": "electronics",
+            "report": [{"name": "Mouse", "total_quantity": 20}, {"name": "Laptop", "total_quantity": 15}],
+        }
+
+        # Another worker refreshes the entry and announces it
+        invalidations = local.invalidations
+        entry = {"report": [{"name": "Mouse", "total_quantity": 99}], "fresh_until": time.time() + 60, "compute_seconds": 0.01}
+        await fake_redis_client.set("report:electronics", json.dumps(entry))
+        await fake_redis_client.publish(INVALIDATION_CHANNEL, "report:electronics")
+        await wait_for(lambda: local.invalidations > invalidations)
+        response = await async_client.get("/report/fast?category=electronics")
+        assert response.json()["report"] == [{"name": "Mouse", "total_quantity": 99}]
+    finally:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+    # Without the subscription nothing is served locally
+    assert not local.active and local.get("report:electronics") is None
+
+@pytest.mark.asyncio
+async def test_redis_pool_waits_for_a_free_connection():
+    pool = InstrumentedBlockingConnectionPool(
+        connection_class=FakeAsyncRedisConnection, server=FakeServer(), max_connections=1, timeout=0.05, decode_responses=True
+    )
+    client = Redis(connection_pool=pool)
+    await client.set("key", "value")
+    held = await pool.get_connection()
+    assert pool.stats() == {"max_connections": 1, "in_use": 1, "idle": 0}
+
+    timeouts = REDIS_POOL_TIMEOUTS.labels().value()
+    with pytest.raises(ConnectionError):
+        await client.get("key")
+    assert REDIS_POOL_TIMEOUTS.labels().value() == timeouts + 1
+
+    await pool.release(held)
+    assert await client.get("key") == "value"
+    assert pool.stats() == {"max_connections": 1, "in_use": 0, "idle": 1}
+    await pool.disconnect()
+
+@pytest.mark.asyncio
+async def test_lifespan_opens_one_shared_redis_pool():
+    # The dependency override is bypassed here: this is the real dependency
+    async with app.router.lifespan_context(app):
+        client = await get_redis_client()
+        assert client is await get_redis_client()
+        assert isinstance(client.connection_pool, InstrumentedBlockingConnectionPool)
+        assert client.connection_pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+        assert f"redis_pool_max_connections {settings.REDIS_MAX_CONNECTIONS}" in REGISTRY.render()
+    with pytest.raises(RuntimeError):
+        await get_redis_client()